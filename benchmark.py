@@ -0,0 +1,322 @@
+"""Benchmark reproducible del pipeline del dashboard, sin navegador.
+
+Genera datos sintéticos con generate_synthetic_data a cada escala y mide
+ingesta (CSV por streaming), validación y compactación del esquema
+(prepare_dataset sobre las filas crudas), construcción del cubo, filtros (máscara
+simple y bitmaps de selección múltiple), calculate_metrics y cada
+constructor de gráficos sobre las filas crudas. Hasta --max-filas-sql
+también carga las filas en una base SQLite temporal y mide el cubo y una
+agregación filtrada resueltos en SQL (SQLSource), contra los mismos
+cálculos en pandas.
+Por etapa registra el mejor tiempo de varias repeticiones, el throughput
+en filas por segundo y el pico de memoria asignada. Cada escala corre en
+un proceso separado para que los picos no se mezclen.
+
+Con --hilos se mide además el escalado del motor de agregación paralela
+(group_sums) con distintas cantidades de hilos a cada escala.
+
+También mide el arranque en un intérprete nuevo: el tiempo de importar el
+módulo (con streamlit ya cargado, como en el servidor), el tiempo hasta la
+pantalla de contraseña y qué bibliotecas pesadas quedaron importadas. Si
+se pasa del presupuesto de arranque cuenta como regresión.
+
+Los resultados se comparan contra un archivo de baseline y el proceso
+termina con código 1 si alguna etapa empeora más que la tolerancia.
+
+Uso:
+    python benchmark.py --escalas 1e4 1e5 1e6 --guardar
+    python benchmark.py --escalas 1e4 1e5 1e6
+    python benchmark.py --escalas 1e7 --hilos 1 2 4 8
+    python benchmark.py --escalas 1e7 1e8 --años 2016 2017 2018 2019 2020 2021 2022 2023 2024 2025 --dimensiones-extra Region=8
+"""
+import argparse
+import json
+import multiprocessing as mp
+import os
+import platform
+import re
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+BASELINE_PATH = Path(__file__).with_name('benchmark_baseline.json')
+APP_PATH = Path(__file__).with_name('dashboardClaude.py')
+# Bibliotecas que el dashboard importa recién cuando las necesita
+IMPORTACIONES_DIFERIDAS = ['plotly.express', 'plotly.subplots', 'openpyxl', 'yaml']
+
+# Ejecuta el script como lo hace Streamlit (__main__) hasta la pantalla de contraseña
+_SCRIPT_PUERTA = """
+import runpy, sys, time
+import streamlit as st
+class Detenido(Exception):
+    pass
+def detener():
+    raise Detenido()
+st.text_input = lambda *args, **kwargs: ''
+st.stop = detener
+inicio = time.perf_counter()
+try:
+    runpy.run_path(sys.argv[1], run_name='__main__')
+except Detenido:
+    pass
+print(time.perf_counter() - inicio, 'pandas' in sys.modules)
+"""
+
+
+def _etapas(df, args, directorio):
+    """Etapas a medir: nombre, filas procesadas y función sin argumentos"""
+    import dashboardClaude as d
+    ultimo_mes = f"{max(args.años)}-06"
+    operacion = df['Tipo_Operacion'].cat.categories[0]
+    mask = d.build_filter_mask(df, operacion, 'Digital')
+    dimensiones = d.filter_dimensions(df)
+    indice = d.BitmapIndex(df, dimensiones)
+    # Selección múltiple: varios canales, la mitad de los valores de cada dimensión adicional
+    seleccion = {'Tipo_Canal': ['Digital', 'Phigital'], 'Mes': [1, 2, 3]}
+    seleccion.update({dim: list(df[dim].cat.categories[::2]) for dim in dimensiones if dim not in d.FILTROS})
+    etapas = []
+    if len(df) <= args.max_filas_csv:
+        csv = df[d.COLUMNAS_REQUERIDAS].to_csv(index=False).encode()
+        etapas.append(('ingesta_csv', len(df), lambda: d.stream_aggregate_bytes(csv, 'benchmark.csv')))
+        # Filas como las lee read_csv: texto y medidas int64
+        crudo = d.normalize_data(df)[d.COLUMNAS_REQUERIDAS].astype(
+            {col: str for col in ['AñoMes'] + d.DIMENSIONES} | {col: 'int64' for col in d.MEDIDAS})
+        etapas.append(('esquema', len(df), lambda: d.prepare_dataset(crudo)))
+    if len(df) <= args.max_filas_sql:
+        fuente = d.SQLSource(Path(directorio) / 'benchmark.sqlite')
+        fuente.append(df)
+        filtros_sql = {'Tipo_Canal': ['Digital', 'Phigital'], 'Mes': [1, 2, 3]}
+        etapas += [
+            ('cubo_sqlite', len(df), fuente.cube),
+            ('agregacion_pandas', len(df), lambda: d.PandasSource(df).aggregate(['Periodo', 'Tipo'], filtros=filtros_sql)),
+            ('agregacion_sqlite', len(df), lambda: fuente.aggregate(['Periodo', 'Tipo'], filtros=filtros_sql)),
+        ]
+    etapas += [
+        ('cubo', len(df), lambda: d.build_cube(df)),
+        ('filtros', len(df), lambda: d.build_filter_mask(df, operacion, 'Digital', '03')),
+        ('indice_bitmap', len(df), lambda: d.BitmapIndex(df, dimensiones)),
+        ('filtros_bitmap', len(df), lambda: indice.mask(seleccion)),
+        ('calculate_metrics', len(df), lambda: d.calculate_metrics(df, ultimo_mes, mask)),
+        ('create_monthly_comparison_chart', len(df), lambda: d.create_monthly_comparison_chart(df, ultimo_mes, mask)),
+        ('create_distribution_chart', len(df), lambda: d.create_distribution_chart(df, ultimo_mes, mask)),
+        ('create_operation_chart', len(df), lambda: d.create_operation_chart(df, ultimo_mes, mask)),
+    ]
+    return etapas
+
+
+def _etapas_agregacion(df, args):
+    """Etapas que agregan filas crudas, para medir el escalado por cantidad de hilos"""
+    import dashboardClaude as d
+    ultimo_mes = f"{max(args.años)}-06"
+    mask = d.build_filter_mask(df, 'Todos', 'Digital')
+    return [
+        ('compare_years', lambda: d.compare_years(df, ultimo_mes, mask=mask)),
+        ('compute_monthly_data', lambda: d.compute_monthly_data(df, ultimo_mes, mask)),
+        ('grouped_sum_cubo', lambda: d.grouped_sum(df, ['AñoMes', 'Tipo', 'Tipo_Operacion', 'Tipo_Canal'])),
+    ]
+
+
+def _medir(func, repeticiones):
+    """Pico de memoria asignada (una corrida trazada) y mejor tiempo de N corridas"""
+    tracemalloc.start()
+    func()
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        func()
+        tiempos.append(time.perf_counter() - inicio)
+    return min(tiempos), pico / 1024 ** 2
+
+
+def _cronometrar(func):
+    inicio = time.perf_counter()
+    func()
+    return time.perf_counter() - inicio
+
+
+def _correr_escala(n_filas, args, cola):
+    import dashboardClaude as d
+    inicio = time.perf_counter()
+    df = d.generate_synthetic_data(n_filas, años=args.años, dimensiones_extra=args.dimensiones_extra)
+    resultado = {
+        'filas': n_filas,
+        'generacion_segundos': round(time.perf_counter() - inicio, 4),
+        'dataset_mb': round(df.memory_usage(deep=True).sum() / 1024 ** 2, 2),
+        'etapas': {},
+    }
+    with tempfile.TemporaryDirectory() as directorio:
+        for nombre, filas, func in _etapas(df, args, directorio):
+            segundos, pico_mb = _medir(func, args.repeticiones)
+            resultado['etapas'][nombre] = {
+                'segundos': round(segundos, 6),
+                'filas_por_segundo': round(filas / segundos) if segundos > 0 else None,
+                'pico_mb': round(pico_mb, 2),
+            }
+    if args.hilos:
+        # Se fuerza el camino paralelo para que también corra con un solo hilo
+        d.PARALLEL_MIN_ROWS = 0
+        resultado['escalado'] = {}
+        for hilos in args.hilos:
+            d.PARALLEL_WORKERS = hilos
+            resultado['escalado'][str(hilos)] = {
+                nombre: round(min(_cronometrar(func) for _ in range(args.repeticiones)), 6)
+                for nombre, func in _etapas_agregacion(df, args)
+            }
+    resultado['pico_rss_mb'] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    cola.put(resultado)
+
+
+def medir_arranque():
+    """Importación del módulo y tiempo hasta la contraseña, cada uno en un intérprete nuevo"""
+    codigo = (f"import streamlit, sys; sys.path.insert(0, {str(APP_PATH.parent)!r}); import dashboardClaude; "
+              f"print([m for m in {IMPORTACIONES_DIFERIDAS!r} if m in sys.modules])")
+    proceso = subprocess.run([sys.executable, '-X', 'importtime', '-c', codigo],
+                             capture_output=True, text=True, check=True)
+    acumulado = re.search(r'\|\s+(\d+) \| dashboardClaude$', proceso.stderr, re.MULTILINE)
+    puerta = subprocess.run([sys.executable, '-c', _SCRIPT_PUERTA, str(APP_PATH)],
+                            capture_output=True, text=True, check=True).stdout.split()
+    return {
+        'importacion_ms': round(int(acumulado.group(1)) / 1000, 1),
+        'diferidas_cargadas': json.loads(proceso.stdout.strip().replace("'", '"')),
+        'puerta_ms': round(float(puerta[0]) * 1000, 1),
+        'pandas_en_puerta': puerta[1] == 'True',
+    }
+
+
+def revisar_arranque(arranque, presupuesto_importacion_ms, presupuesto_puerta_ms):
+    """Lista de problemas del arranque contra los presupuestos"""
+    problemas = []
+    if arranque['importacion_ms'] > presupuesto_importacion_ms:
+        problemas.append(f"importación {arranque['importacion_ms']} ms > {presupuesto_importacion_ms} ms")
+    if arranque['puerta_ms'] > presupuesto_puerta_ms:
+        problemas.append(f"contraseña {arranque['puerta_ms']} ms > {presupuesto_puerta_ms} ms")
+    if arranque['diferidas_cargadas']:
+        problemas.append(f"importaciones diferidas cargadas al inicio: {', '.join(arranque['diferidas_cargadas'])}")
+    if arranque['pandas_en_puerta']:
+        problemas.append("pandas se importa antes de la contraseña")
+    return problemas
+
+
+def _parse_extra(valores):
+    extras = {}
+    for valor in valores or []:
+        nombre, _, cantidad = valor.partition('=')
+        extras[nombre] = int(cantidad or 10)
+    return extras
+
+
+def comparar(resultados, baseline, tolerancia, min_segundos=0.005):
+    """Comparar tiempos contra la baseline y devolver la lista de regresiones.
+
+    Las etapas que tardan menos de min_segundos no se marcan: a esa escala
+    el ruido de medición supera cualquier diferencia real.
+    """
+    regresiones = []
+    for escala, resultado in resultados['escalas'].items():
+        base = baseline.get('escalas', {}).get(escala)
+        if base is None:
+            continue
+        for etapa, medida in resultado['etapas'].items():
+            medida_base = base['etapas'].get(etapa)
+            if not medida_base or not medida_base['segundos']:
+                continue
+            ratio = medida['segundos'] / medida_base['segundos']
+            marca = ''
+            if ratio > 1 + tolerancia and medida['segundos'] >= min_segundos:
+                marca = '  <-- REGRESIÓN'
+                regresiones.append((escala, etapa, ratio))
+            print(f"  {escala:>11} {etapa:<32} {medida_base['segundos']:>10.4f}s -> {medida['segundos']:>10.4f}s "
+                  f"({ratio:5.2f}x){marca}")
+    return regresiones
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--escalas', nargs='+', type=float, default=[1e4, 1e5, 1e6])
+    parser.add_argument('--repeticiones', type=int, default=3)
+    parser.add_argument('--años', nargs='+', type=int, default=[2024, 2025])
+    parser.add_argument('--dimensiones-extra', nargs='*', metavar='NOMBRE=CANTIDAD')
+    parser.add_argument('--max-filas-csv', type=float, default=1e6,
+                        help='Escala máxima en la que se mide la ingesta CSV (serializar el CSV es lento)')
+    parser.add_argument('--max-filas-sql', type=float, default=1e6,
+                        help='Escala máxima en la que se mide el origen SQLite (cargar la base es lento)')
+    parser.add_argument('--hilos', nargs='+', type=int,
+                        help='Cantidades de hilos con las que medir el escalado de la agregación')
+    parser.add_argument('--presupuesto-importacion-ms', type=float, default=1000,
+                        help='Tiempo máximo de importación del módulo con streamlit ya cargado')
+    parser.add_argument('--presupuesto-puerta-ms', type=float, default=400,
+                        help='Tiempo máximo hasta la pantalla de contraseña')
+    parser.add_argument('--baseline', type=Path, default=BASELINE_PATH)
+    parser.add_argument('--guardar', action='store_true', help='Guardar los resultados como nueva baseline')
+    parser.add_argument('--tolerancia', type=float, default=0.2)
+    parser.add_argument('--min-segundos', type=float, default=0.005,
+                        help='Tiempo mínimo de una etapa para considerarla regresión')
+    args = parser.parse_args()
+    args.dimensiones_extra = _parse_extra(args.dimensiones_extra)
+
+    import numpy as np
+    import pandas as pd
+    resultados = {
+        'entorno': {
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'numpy': np.__version__,
+            'cpus': os.cpu_count(),
+            'maquina': platform.machine(),
+        },
+        'parametros': {'años': args.años, 'dimensiones_extra': args.dimensiones_extra,
+                       'repeticiones': args.repeticiones, 'hilos': args.hilos},
+        'escalas': {},
+    }
+    resultados['arranque'] = medir_arranque()
+    arranque = resultados['arranque']
+    print(f"Arranque: importación {arranque['importacion_ms']} ms, contraseña {arranque['puerta_ms']} ms, "
+          f"diferidas cargadas: {', '.join(arranque['diferidas_cargadas']) or 'ninguna'}")
+    problemas_arranque = revisar_arranque(arranque, args.presupuesto_importacion_ms, args.presupuesto_puerta_ms)
+    for problema in problemas_arranque:
+        print(f"  <-- PRESUPUESTO: {problema}")
+    ctx = mp.get_context('spawn')
+    for escala in args.escalas:
+        n_filas = int(escala)
+        cola = ctx.Queue()
+        proceso = ctx.Process(target=_correr_escala, args=(n_filas, args, cola))
+        proceso.start()
+        resultado = cola.get()
+        proceso.join()
+        resultados['escalas'][str(n_filas)] = resultado
+        print(f"{n_filas:,} filas ({resultado['dataset_mb']} MB, pico RSS {resultado['pico_rss_mb']} MB)")
+        for etapa, medida in resultado['etapas'].items():
+            print(f"  {etapa:<32} {medida['segundos']:>10.4f}s {medida['filas_por_segundo'] or 0:>14,} filas/s "
+                  f"{medida['pico_mb']:>10.1f} MB")
+        if 'escalado' in resultado:
+            base = resultado['escalado'][str(args.hilos[0])]
+            print(f"  Escalado de la agregación (aceleración contra {args.hilos[0]} hilo/s):")
+            for hilos, tiempos in resultado['escalado'].items():
+                detalle = ' '.join(f"{etapa} {segundos:.4f}s ({base[etapa] / segundos:4.2f}x)"
+                                   for etapa, segundos in tiempos.items())
+                print(f"    {hilos:>3} hilos: {detalle}")
+
+    regresiones = []
+    if args.baseline.exists():
+        print(f"\nComparación contra {args.baseline}:")
+        regresiones = comparar(resultados, json.loads(args.baseline.read_text()), args.tolerancia,
+                               args.min_segundos)
+    if args.guardar:
+        args.baseline.write_text(json.dumps(resultados, indent=2, ensure_ascii=False))
+        print(f"\nBaseline guardada en {args.baseline}")
+    if regresiones:
+        print(f"\n{len(regresiones)} etapas empeoraron más de {args.tolerancia:.0%}")
+    if problemas_arranque:
+        print(f"\nEl arranque no cumple el presupuesto: {'; '.join(problemas_arranque)}")
+    if regresiones or problemas_arranque:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
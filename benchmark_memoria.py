@@ -0,0 +1,125 @@
+"""Benchmark de memoria del pipeline de filtros y métricas.
+
+Compara el pico de memoria del pipeline anterior (df.copy(), filtros
+encadenados, subconjuntos por año y pd.concat) con el actual (una sola
+máscara booleana y sumas sin materializar subconjuntos). Cada pipeline
+corre en un proceso separado para que el pico de RSS no se mezcle.
+
+Uso:
+    python benchmark_memoria.py --filas 2000000
+    python benchmark_memoria.py --filas 2000000 --operacion Pagos --canal Digital
+"""
+import argparse
+import multiprocessing as mp
+import resource
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+
+def build_dataset(n_filas):
+    """Replicar los datos de ejemplo normalizados hasta n_filas"""
+    from dashboardClaude import create_sample_data, normalize_data
+    base = normalize_data(create_sample_data())
+    posiciones = np.resize(np.arange(len(base)), n_filas)
+    return base.iloc[posiciones].reset_index(drop=True)
+
+
+def pipeline_anterior(df, ultimo_mes_datos_reales, operacion, canal, mes):
+    """Pipeline previo: copia completa y un subconjunto materializado por filtro"""
+    from dashboardClaude import periodo_key
+    ultimo_periodo = periodo_key(ultimo_mes_datos_reales)
+    df_filtered = df.copy()
+    if operacion != 'Todos':
+        df_filtered = df_filtered[df_filtered['Tipo_Operacion'] == operacion]
+    if canal != 'Todos':
+        df_filtered = df_filtered[df_filtered['Tipo_Canal'] == canal]
+    if mes != 'Todos':
+        df_filtered = df_filtered[df_filtered['Mes'] == int(mes)]
+
+    # calculate_metrics
+    real_2025 = df_filtered[(df_filtered['Año'] == 2025) & (df_filtered['Tipo'] == 'Real') &
+                           (df_filtered['Periodo'] <= ultimo_periodo)]
+    presupuesto_2025 = df_filtered[(df_filtered['Año'] == 2025) & (df_filtered['Tipo'] == 'Presupuesto') &
+                                  (df_filtered['Periodo'] <= ultimo_periodo)]
+    real_2024 = df_filtered[(df_filtered['Año'] == 2024) & (df_filtered['Tipo'] == 'Real') &
+                           (df_filtered['Mes'] <= ultimo_periodo % 100)]
+    totales = [sub[['Trx', 'Ingresos', 'Recaudacion']].sum() for sub in (real_2025, presupuesto_2025, real_2024)]
+
+    # create_monthly_comparison_chart
+    df_2025 = df_filtered[(df_filtered['Año'] == 2025) & (df_filtered['Periodo'] <= ultimo_periodo)]
+    df_2024 = df_filtered[(df_filtered['Año'] == 2024) & (df_filtered['Tipo'] == 'Real')]
+    monthly_data = pd.concat([df_2025, df_2024]).groupby(['Periodo', 'Tipo'], observed=True)[
+        ['Trx', 'Ingresos', 'Recaudacion']].sum()
+    return totales, monthly_data
+
+
+def pipeline_actual(df, ultimo_mes_datos_reales, operacion, canal, mes):
+    """Pipeline actual: una máscara y sumas sin copias del frame"""
+    from dashboardClaude import build_filter_mask, calculate_metrics, compute_monthly_data
+    mask = build_filter_mask(df, operacion, canal, mes)
+    metrics = calculate_metrics(df, ultimo_mes_datos_reales, mask)
+    monthly_data = compute_monthly_data(df, ultimo_mes_datos_reales, mask)
+    return metrics, monthly_data
+
+
+def _rss_actual_mb():
+    """RSS actual del proceso en MB (Linux)"""
+    with open('/proc/self/statm') as f:
+        paginas = int(f.read().split()[1])
+    return paginas * resource.getpagesize() / 1024 ** 2
+
+
+def _medir(nombre, args, cola):
+    df = build_dataset(args.filas)
+    pipeline = pipeline_anterior if nombre == 'anterior' else pipeline_actual
+    rss_inicial = _rss_actual_mb()
+    tracemalloc.start()
+    inicio = time.perf_counter()
+    pipeline(df, args.ultimo_mes, args.operacion, args.canal, args.mes)
+    duracion = time.perf_counter() - inicio
+    _, pico_traza = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    pico_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    cola.put({
+        'pipeline': nombre,
+        'dataset_mb': df.memory_usage(deep=True).sum() / 1024 ** 2,
+        'pico_asignado_mb': pico_traza / 1024 ** 2,
+        'rss_inicial_mb': rss_inicial,
+        'pico_rss_mb': pico_rss,
+        'segundos': duracion,
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--filas', type=int, default=1_000_000)
+    parser.add_argument('--ultimo-mes', default='2025-06')
+    parser.add_argument('--operacion', default='Todos')
+    parser.add_argument('--canal', default='Todos')
+    parser.add_argument('--mes', default='Todos')
+    args = parser.parse_args()
+
+    ctx = mp.get_context('spawn')
+    resultados = {}
+    for nombre in ('anterior', 'actual'):
+        cola = ctx.Queue()
+        proceso = ctx.Process(target=_medir, args=(nombre, args, cola))
+        proceso.start()
+        resultados[nombre] = cola.get()
+        proceso.join()
+
+    print(f"Filas: {args.filas:,} | Dataset: {resultados['actual']['dataset_mb']:.1f} MB")
+    for r in resultados.values():
+        print(f"{r['pipeline']:>9}: pico asignado {r['pico_asignado_mb']:8.1f} MB | "
+              f"pico RSS {r['pico_rss_mb']:8.1f} MB (inicial {r['rss_inicial_mb']:.1f} MB) | "
+              f"{r['segundos']:.3f} s")
+    anterior, actual = resultados['anterior'], resultados['actual']
+    print(f"Reducción del pico asignado: {anterior['pico_asignado_mb'] / max(actual['pico_asignado_mb'], 1e-9):.1f}x")
+    print(f"Reducción del pico RSS: {anterior['pico_rss_mb'] - actual['pico_rss_mb']:.1f} MB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""Carga de archivos Excel o CSV en la base analítica embebida del dashboard.
+
+Lee cada archivo por bloques, sin cargarlo entero, valida y normaliza las
+filas como el dashboard (clean_chunk: las filas con errores se descartan
+y se informan) y las agrega a la tabla de la base: DuckDB si la ruta
+termina en .duckdb (requiere el paquete duckdb) o SQLite si termina en
+.sqlite/.db. Con DASHBOARD_DB apuntando a la base, el dashboard resuelve
+los filtros y las agrupaciones en SQL sobre el archivo y solo guarda en
+memoria el cubo agregado, así que la historia puede tener muchos años y
+millones de filas.
+
+Cada archivo se carga en una sola transacción. Como al agregar períodos
+en el dashboard, un archivo con pares (Periodo, Tipo) que ya están en la
+base, o en un archivo anterior de la misma carga, se rechaza entero; con
+--reemplazar la base se vacía antes de cargar.
+
+Uso:
+    python cargar_base.py historia.sqlite datos_2016.csv datos_2017.xlsx
+    python cargar_base.py historia.duckdb datos.csv --reemplazar
+    DASHBOARD_DB=historia.sqlite streamlit run dashboardClaude.py
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+
+def cargar_archivo(source, ruta, chunk_rows, existentes):
+    """Agregar las filas válidas de un archivo a la base por bloques y devolver cuántas se cargaron.
+
+    existentes son los pares (Periodo, Tipo) ya cargados; se actualiza con
+    los del archivo cuando la transacción se confirma.
+    """
+    import dashboardClaude as d
+    filas = 0
+    rechazos = []
+    nuevos = set()
+    try:
+        with source.transaction() as con:
+            for chunk, avance in d.iter_file_chunks(ruta.read_bytes(), ruta.name, chunk_rows):
+                chunk, rechazos_bloque = d.clean_chunk(chunk)
+                periodos = d.period_pairs(chunk)
+                d.check_new_periods(existentes, periodos)
+                nuevos |= periodos
+                source.append(chunk, con)
+                filas += len(chunk)
+                rechazos.append(rechazos_bloque)
+                if avance is not None:
+                    print(f"\r  {ruta.name}: {filas:,} filas ({avance:.0%})", end='', flush=True)
+    except ValueError as e:
+        print()
+        raise ValueError(f"{ruta.name} no se cargó: {e}. Use --reemplazar para recargar la base desde cero") from e
+    print()
+    existentes |= nuevos
+    rechazos = d.merge_rejections(rechazos)
+    if rechazos['filas']:
+        print(f"  {ruta.name}: {rechazos['filas']:,} filas rechazadas")
+        for motivo, n in rechazos['motivos'].items():
+            print(f"    {motivo}: {n:,}")
+        for ejemplo in rechazos['ejemplos'][:10]:
+            print(f"    fila {ejemplo['fila']}: {ejemplo['columna']} = {ejemplo['valor']!r} ({ejemplo['motivo']})")
+    return filas
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('base', type=Path, help='Archivo de la base (.duckdb, .sqlite o .db)')
+    parser.add_argument('archivos', nargs='+', type=Path, help='Archivos .xlsx o .csv a cargar')
+    parser.add_argument('--tabla', help='Tabla de la base; por defecto la del dashboard (DASHBOARD_DB_TABLE)')
+    parser.add_argument('--reemplazar', action='store_true', help='Borrar las filas existentes antes de cargar')
+    parser.add_argument('--filas-por-bloque', type=int, default=200_000)
+    args = parser.parse_args()
+
+    import dashboardClaude as d
+    try:
+        source = d.SQLSource(args.base, args.tabla or d.DATA_DB_TABLE)
+        if args.reemplazar and args.base.exists():
+            source.drop()
+        inicio = time.perf_counter()
+        existentes = source.existing_periods()
+        total = sum(cargar_archivo(source, ruta, args.filas_por_bloque, existentes) for ruta in args.archivos)
+    except (ImportError, ValueError) as e:
+        sys.exit(f"Error: {e}")
+    print(f"{total:,} filas cargadas en {time.perf_counter() - inicio:.1f} s; "
+          f"la base tiene {source.filas():,} filas ({source.motor})")
+
+
+if __name__ == '__main__':
+    main()
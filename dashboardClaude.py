@@ -1,60 +1,206 @@
 import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+def check_password():
+    """Configurar la página y validar la contraseña; solo necesita streamlit"""
+    # Configuración de la página
+    st.set_page_config(
+        page_title="Dashboard Financiero",
+        page_icon="💰",
+        layout="wide",
+        initial_sidebar_state="expanded")
+
+    # Autenticación básica
+    st.title("Dashboard GIRE")
+
+    password = st.text_input("Contraseña", type="password")
+
+    if password != "Gire2025":
+        st.warning("Contraseña incorrecta")
+        st.stop()
+
+if __name__ == "__main__":
+    # Streamlit ejecuta el script como __main__: la contraseña se pide antes de importar
+    # pandas y numpy, así la primera pantalla no espera esas importaciones. Los scripts
+    # que importan este módulo (benchmark, exportación) no pasan por acá.
+    check_password()
+
 import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
 import numpy as np
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing, contextmanager
 from datetime import datetime
+from functools import wraps
+from pathlib import Path
+import hashlib
+import io
+import itertools
+import json
+import os
+import resource
+import tempfile
+import threading
+import time
 import warnings
-import openpyxl 
 warnings.filterwarnings('ignore')
+# plotly, openpyxl y yaml se importan dentro de las funciones que los usan: la pantalla
+# de contraseña y los reruns sin gráficos no pagan su importación
 
-# Configuración de la página
-st.set_page_config(
-    page_title="Dashboard Financiero",
-    page_icon="💰",
-    layout="wide",
-    initial_sidebar_state="expanded")
+# Caché en disco de datasets normalizados (Parquet, indexada por hash del contenido)
+CACHE_DIR = Path(os.environ.get('DASHBOARD_CACHE_DIR', '.cache_dashboard'))
+CACHE_MAX_BYTES = int(os.environ.get('DASHBOARD_CACHE_MAX_MB', '512')) * 1024 * 1024
+# Se incrementa cuando cambia el formato normalizado, para no leer cachés viejas
+CACHE_VERSION = 4
 
-# Autenticación básica
-st.title("Dashboard GIRE")
+# Dimensiones y medidas del cubo pre-agregado
+CUBE_KEYS = ['Periodo', 'Tipo', 'Tipo_Operacion', 'Tipo_Canal']
+MEDIDAS = ['Trx', 'Ingresos', 'Recaudacion']
+DIMENSIONES = ['Tipo_Operacion', 'Tipo_Canal', 'Tipo']
+TIPOS = ['Real', 'Presupuesto']
+# Colores de las series de años de referencia en el gráfico de precio YoY
+COLORES_REFERENCIA = ['#7c3aed', '#0ea5e9', '#f97316', '#84cc16', '#64748b']
+COLUMNAS_REQUERIDAS = ['AñoMes', 'Tipo_Operacion', 'Tipo_Canal', 'Trx', 'Ingresos', 'Recaudacion', 'Tipo']
+# Validación del esquema al ingerir: filas de ejemplo guardadas por reporte de rechazos
+MAX_EJEMPLOS_RECHAZO = 50
+# Tipos candidatos de las medidas, del más chico al más grande
+TIPOS_ENTEROS = [np.int8, np.int16, np.int32, np.int64]
+# Filtros de selección múltiple del sidebar; las columnas de texto adicionales del archivo
+# se suman como filtros si tienen hasta MAX_VALORES_FILTRO valores distintos
+FILTROS = {'Tipo_Operacion': "🏪 Tipo de Operación", 'Tipo_Canal': "📱 Canal", 'Mes': "📅 Mes"}
+MAX_VALORES_FILTRO = 500
 
-password = st.text_input("Contraseña", type="password")
+# Base analítica embebida con la historia completa (DuckDB si la extensión es .duckdb,
+# SQLite si no): los filtros y agrupaciones se resuelven en SQL y al proceso solo
+# llega el cubo. Sin DASHBOARD_DB se usan los datos en memoria
+DATA_DB_PATH = os.environ.get('DASHBOARD_DB')
+DATA_DB_TABLE = os.environ.get('DASHBOARD_DB_TABLE', 'hechos')
+DB_PREFIX = 'db:'
+EXTENSIONES_DUCKDB = ('.duckdb', '.ddb')
+EXTENSIONES_SQLITE = ('.sqlite', '.sqlite3', '.db')
 
-if password != "Gire2025":
-    st.warning("Contraseña incorrecta")
-    st.stop()
+# Ingesta por streaming: filas por bloque y bloques parciales antes de compactar
+STREAM_CHUNK_ROWS = 50_000
+STREAM_MAX_PARTIALS = 20
 
-# CSS personalizado
-st.markdown("""
-<style>
-    .main-header {
-        font-size: 2.5rem;
-        font-weight: bold;
-        color: #1f2937;
-        text-align: center;
-        margin-bottom: 2rem;
-    }
-    .metric-card {
-        background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-        padding: 1rem;
-        border-radius: 10px;
-        color: white;
-        text-align: center;
-    }
-    .kpi-positive {
-        color: #10b981;
-        font-weight: bold;
-    }
-    .kpi-negative {
-        color: #ef4444;
-        font-weight: bold;
-    }
-    .sidebar .sidebar-content {
-        background: linear-gradient(180deg, #f8fafc 0%, #e2e8f0 100%);
-    }
-</style>
-""", unsafe_allow_html=True)
+# Registro compartido de datasets entre sesiones
+SAMPLE_HASH = 'ejemplo'
+SESSION_TTL_SECONDS = 30 * 60
+
+# Secciones de análisis; solo se renderiza la seleccionada
+SECCIONES = ["📈 Tendencias", "🥧 Distribución", "📋 Tabla Resumen", "🚨 Alertas"]
+
+# Gráficos: a partir de MAX_PUNTOS_SVG puntos por traza se usa WebGL, y las series
+# se reducen en el servidor a MAX_PUNTOS_TRAZA puntos; tortas y barras por categoría
+# agrupan en "Otros" lo que exceda MAX_CATEGORIAS
+MAX_PUNTOS_SVG = 1_000
+MAX_PUNTOS_TRAZA = 2_000
+MAX_CATEGORIAS = 15
+
+# Agregación paralela: por encima de PARALLEL_MIN_ROWS filas las sumas por grupo se
+# calculan en bloques de PARALLEL_BLOCK_ROWS filas repartidos entre PARALLEL_WORKERS hilos
+PARALLEL_MIN_ROWS = int(os.environ.get('DASHBOARD_PARALLEL_MIN_ROWS', '2000000'))
+PARALLEL_BLOCK_ROWS = 1_000_000
+PARALLEL_WORKERS = int(os.environ.get('DASHBOARD_WORKERS', os.cpu_count() or 1))
+# Con más combinaciones que esto las tablas de bincount no convienen y se usa groupby
+PARALLEL_MAX_GROUPS = 1_000_000
+
+# Memoización de métricas y figuras por vista
+MEMO_MAX_ENTRIES = 4096
+MEMO_TTL_SECONDS = 15 * 60
+
+# Precálculo en segundo plano de todas las vistas de un dataset: hasta PRECOMPUTE_MAX_ENTRIES
+# entradas por dataset, fijas en la caché (sin vencimiento). Entre todos los datasets las
+# fijas tampoco pasan de PRECOMPUTE_MAX_ENTRIES: se expulsan datasets enteros en orden LRU
+PRECOMPUTE_ENABLED = os.environ.get('DASHBOARD_PRECOMPUTE', '1') != '0'
+PRECOMPUTE_MAX_ENTRIES = 3 * MEMO_MAX_ENTRIES // 4
+# Un trabajo terminado que perdió sus entradas se relanza a lo sumo una vez en este lapso
+PRECOMPUTE_RETRY_SECONDS = 5 * 60
+# Pausa entre tareas para ceder el GIL a los reruns de las sesiones
+PRECOMPUTE_PAUSE_SECONDS = 0.002
+
+# Reglas de alertas (YAML) y cantidad máxima de alertas por segmento que se muestran
+ALERT_RULES_PATH = Path(os.environ.get('DASHBOARD_ALERT_RULES', Path(__file__).with_name('alertas.yaml')))
+NIVELES_ALERTA = ['error', 'warning', 'info', 'success']
+OPERADORES_ALERTA = {'<': np.less, '<=': np.less_equal, '>': np.greater, '>=': np.greater_equal}
+METRICAS_ALERTA = ([f'var_presupuesto_{m}' for m in ('trx', 'ingresos', 'recaudacion')] +
+                   [f'var_año_anterior_{m}' for m in ('trx', 'ingresos', 'recaudacion')] +
+                   ['precio_prom', 'dif_precio', 'dif_precio_presupuesto',
+                    'factura_prom', 'dif_factura', 'dif_factura_presupuesto'])
+MAX_ALERTAS_SEGMENTO = 50
+
+# Instrumentación: historial de etapas por sesión y archivo JSONL opcional
+PERF_HISTORY_MAX = 500
+PERF_LOG_PATH = os.environ.get('DASHBOARD_PERF_LOG')
+
+# Registros de la ejecución en curso; cada rerun de Streamlit corre en su propio hilo
+_perf_local = threading.local()
+
+def _rss_mb():
+    """Memoria residente actual del proceso en MB"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * resource.getpagesize() / 1024 ** 2
+    except OSError:
+        # Sin /proc (macOS): se usa el pico, que al menos detecta crecimientos
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def start_perf_recording():
+    """Empezar a registrar etapas en el hilo actual y devolver la lista de registros"""
+    _perf_local.registros = []
+    return _perf_local.registros
+
+def stop_perf_recording():
+    """Dejar de registrar etapas en el hilo actual"""
+    _perf_local.registros = None
+
+@contextmanager
+def perf_stage(etapa, filas=None):
+    """Medir tiempo, filas y delta de memoria de una etapa si hay registro activo.
+
+    Entrega un dict en el que se pueden completar las filas si recién se
+    conocen al terminar la etapa.
+    """
+    info = {'filas': filas}
+    registros = getattr(_perf_local, 'registros', None)
+    if registros is None:
+        yield info
+        return
+    rss_inicial = _rss_mb()
+    inicio = time.perf_counter()
+    try:
+        yield info
+    finally:
+        registros.append({
+            'etapa': etapa,
+            'segundos': round(time.perf_counter() - inicio, 6),
+            'filas': info['filas'],
+            'memoria_mb': round(_rss_mb() - rss_inicial, 3),
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+        })
+
+def instrumented(etapa):
+    """Decorador que mide la función como una etapa.
+
+    Las filas son las del primer DataFrame recibido o, si no recibe
+    ninguno, las del primer DataFrame que devuelve.
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            filas = next((len(a) for a in args if isinstance(a, pd.DataFrame)), None)
+            with perf_stage(etapa, filas) as info:
+                resultado = func(*args, **kwargs)
+                if info['filas'] is None:
+                    salidas = resultado if isinstance(resultado, tuple) else (resultado,)
+                    info['filas'] = next((len(r) for r in salidas if isinstance(r, pd.DataFrame)), None)
+                return resultado
+        return wrapper
+    return decorator
+
+def export_perf_jsonl(registros):
+    """Serializar registros de rendimiento como JSON lines"""
+    return ''.join(json.dumps(r, ensure_ascii=False) + '\n' for r in registros)
 
 def create_sample_data():
     """Crear datos de ejemplo para demostración"""
@@ -114,83 +260,1490 @@ def create_sample_data():
     
     return pd.DataFrame(data)
 
-def load_data():
-    """Cargar datos desde archivo o usar datos de ejemplo"""
-    if 'df' not in st.session_state:
-        st.session_state.df = create_sample_data()
-    df = st.session_state.df
-    # Calcular último mes de datos reales
-    ultimo_mes_datos_reales = df[df['Tipo'] == 'Real']['AñoMes'].max()
-    # Obtener meses disponibles para 2025
-    meses_2025 = sorted(df[(df['AñoMes'].str.startswith('2025')) & (df['Tipo'] == 'Real')]['AñoMes'].unique())
-    return df, ultimo_mes_datos_reales, meses_2025
-
-def calculate_metrics(df_filtered, ultimo_mes_datos_reales):
-    """Calcular métricas principales"""
-    # Separar datos por año y tipo, limitando al último mes de datos reales para acumulados
-    real_2025 = df_filtered[(df_filtered['AñoMes'].str.startswith('2025')) & 
-                           (df_filtered['Tipo'] == 'Real') & 
-                           (df_filtered['AñoMes'] <= ultimo_mes_datos_reales)]
-    presupuesto_2025 = df_filtered[(df_filtered['AñoMes'].str.startswith('2025')) & 
-                                  (df_filtered['Tipo'] == 'Presupuesto') & 
-                                  (df_filtered['AñoMes'] <= ultimo_mes_datos_reales)]
-    real_2024 = df_filtered[(df_filtered['AñoMes'].str.startswith('2024')) & 
-                           (df_filtered['Tipo'] == 'Real') & 
-                           (df_filtered['AñoMes'].str[-2:] <= ultimo_mes_datos_reales[-2:])]
-    
-    # Calcular totales
-    metrics = {}
-    
-    # Totales 2025 Real
-    metrics['real_2025'] = {
-        'trx': real_2025['Trx'].sum(),
-        'ingresos': real_2025['Ingresos'].sum(),
-        'recaudacion': real_2025['Recaudacion'].sum()
+def generate_synthetic_data(n_filas, años=(2024, 2025), operaciones=('Cobranzas', 'Pagos', 'Otros'),
+                            canales=('Digital', 'Físico', 'Phigital'), dimensiones_extra=None,
+                            meses=12, semilla=42, chunk_rows=5_000_000):
+    """Generar datos sintéticos ya normalizados, a cualquier escala.
+
+    Sigue la forma de create_sample_data: los años anteriores solo tienen
+    Real y el último año tiene Real y Presupuesto, con Cobranzas de mayor
+    volumen que el resto de las operaciones. dimensiones_extra mapea el
+    nombre de cada columna adicional a su cantidad de valores o a la lista
+    de valores. Todo se genera con operaciones vectorizadas por bloques que
+    se escriben en las columnas del resultado, reservadas de antemano, así
+    que 10^8 filas solo requieren la memoria del resultado.
+    """
+    rng = np.random.default_rng(semilla)
+    años = np.asarray(sorted(años), dtype=np.int32)
+    extras = {
+        nombre: ([f"{nombre}_{i}" for i in range(valores)] if isinstance(valores, int) else list(valores))
+        for nombre, valores in (dimensiones_extra or {}).items()
     }
-    
-    # Totales 2025 Presupuesto
-    metrics['presupuesto_2025'] = {
-        'trx': presupuesto_2025['Trx'].sum(),
-        'ingresos': presupuesto_2025['Ingresos'].sum(),
-        'recaudacion': presupuesto_2025['Recaudacion'].sum()
+    periodos = (años[:, None] * 100 + np.arange(1, meses + 1)[None, :]).ravel()
+    # El último año pesa el doble: la mitad de sus filas son Presupuesto y el Real queda parejo entre años
+    pesos = np.where(periodos // 100 == años[-1], 2.0, 1.0)
+    pesos /= pesos.sum()
+    es_cobranzas = np.array([op == 'Cobranzas' for op in operaciones])
+
+    def codigos(n_valores):
+        return np.empty(n_filas, dtype=np.min_scalar_type(-n_valores))
+
+    categorias = {
+        'AñoMes': pd.CategoricalDtype([format_periodo(int(p)) for p in periodos], ordered=True),
+        'Tipo_Operacion': pd.CategoricalDtype(list(operaciones)),
+        'Tipo_Canal': pd.CategoricalDtype(list(canales)),
+        'Tipo': pd.CategoricalDtype(TIPOS),
+        **{nombre: pd.CategoricalDtype(valores) for nombre, valores in extras.items()},
     }
-    
-    # Totales 2024 Real
-    metrics['real_2024'] = {
-        'trx': real_2024['Trx'].sum(),
-        'ingresos': real_2024['Ingresos'].sum(),
-        'recaudacion': real_2024['Recaudacion'].sum()
+    columnas = {
+        'AñoMes': codigos(len(periodos)),
+        'Tipo_Operacion': codigos(len(operaciones)),
+        'Tipo_Canal': codigos(len(canales)),
+        'Trx': np.empty(n_filas, dtype=np.int32),
+        'Ingresos': np.empty(n_filas, dtype=np.int32),
+        'Recaudacion': np.empty(n_filas, dtype=np.int32),
+        'Tipo': codigos(len(TIPOS)),
+        'Periodo': np.empty(n_filas, dtype=np.int32),
+        'Año': np.empty(n_filas, dtype=np.int16),
+        'Mes': np.empty(n_filas, dtype=np.int8),
+        **{nombre: codigos(len(valores)) for nombre, valores in extras.items()},
     }
+    for inicio in range(0, n_filas, chunk_rows):
+        n = min(chunk_rows, n_filas - inicio)
+        bloque = {nombre: columna[inicio:inicio + n] for nombre, columna in columnas.items()}
+        idx_periodo = rng.choice(len(periodos), n, p=pesos)
+        periodo = periodos[idx_periodo]
+        op = rng.integers(0, len(operaciones), n)
+        # Presupuesto solo en el último año, como en los datos de ejemplo
+        tipo = np.where(periodo // 100 == años[-1], rng.integers(0, 2, n), 0).astype(np.int8)
+        trx = np.where(es_cobranzas[op], rng.integers(800, 1600, n), rng.integers(200, 650, n))
+        ingresos = trx * rng.uniform(60, 125, n)
+        recaudacion = ingresos * rng.uniform(0.85, 0.98, n)
+        presup = tipo == 1
+        trx[presup] = (trx[presup] * 0.95).astype(trx.dtype)
+        ingresos[presup] *= 0.93
+        recaudacion[presup] *= 0.94
+
+        bloque['AñoMes'][:] = idx_periodo
+        bloque['Tipo_Operacion'][:] = op
+        bloque['Tipo_Canal'][:] = rng.integers(0, len(canales), n)
+        bloque['Trx'][:] = trx
+        bloque['Ingresos'][:] = ingresos
+        bloque['Recaudacion'][:] = recaudacion
+        bloque['Tipo'][:] = tipo
+        bloque['Periodo'][:] = periodo
+        bloque['Año'][:] = periodo // 100
+        bloque['Mes'][:] = periodo % 100
+        for nombre, valores in extras.items():
+            bloque[nombre][:] = rng.integers(0, len(valores), n)
+    # Las columnas se envuelven sin copiarlas
+    return pd.DataFrame({
+        nombre: pd.Categorical.from_codes(columna, dtype=categorias[nombre]) if nombre in categorias else columna
+        for nombre, columna in columnas.items()
+    }, copy=False)
+
+def periodo_key(año_mes):
+    """Convertir 'YYYY-MM' en la clave entera YYYYMM"""
+    return int(año_mes[:4]) * 100 + int(año_mes[5:7])
+
+def format_periodo(periodo):
+    """Convertir la clave entera YYYYMM en 'YYYY-MM'"""
+    return f"{periodo // 100:04d}-{periodo % 100:02d}"
+
+def add_period_columns(df):
+    """Agregar columnas enteras Año y Mes y el texto AñoMes a partir de Periodo"""
+    periodos = df['Periodo'].to_numpy()
+    df['Año'] = (periodos // 100).astype(np.int16)
+    df['Mes'] = (periodos % 100).astype(np.int8)
+    df['AñoMes'] = [format_periodo(p) for p in periodos]
+    return df
+
+def normalize_data(df):
+    """Normalizar columnas: claves enteras de período y dimensiones categóricas"""
+    df = df.copy()
+    # Excel puede convertir AñoMes en fecha; se lleva siempre a texto 'YYYY-MM'
+    if pd.api.types.is_datetime64_any_dtype(df['AñoMes']):
+        año_mes = df['AñoMes'].dt.strftime('%Y-%m')
+    else:
+        año_mes = df['AñoMes'].astype(str).str.strip().str[:7]
+    # Los períodos se parsean una vez por valor distinto, no por fila
+    año_mes = año_mes.astype('category')
+    periodos_cat = np.array([periodo_key(v) for v in año_mes.cat.categories], dtype=np.int32)
+    periodos = periodos_cat[año_mes.cat.codes.to_numpy()]
+    df['AñoMes'] = año_mes.cat.reorder_categories(
+        list(año_mes.cat.categories[np.argsort(periodos_cat)]), ordered=True)
+    df['Periodo'] = periodos
+    df['Año'] = (periodos // 100).astype(np.int16)
+    df['Mes'] = (periodos % 100).astype(np.int8)
+    for col in DIMENSIONES:
+        valores = df[col].astype(str).str.strip()
+        if col == 'Tipo':
+            # Códigos fijos: Real y Presupuesto siempre primero
+            categorias = TIPOS + sorted(set(valores.unique()) - set(TIPOS))
+        else:
+            categorias = sorted(valores.unique())
+        df[col] = pd.Categorical(valores, categories=categorias)
+    for col in extra_dimensions(df):
+        df[col] = df[col].astype(str).str.strip().astype('category')
+    return df
+
+def _empty_rejections():
+    return {'filas': 0, 'motivos': {}, 'ejemplos': []}
+
+def validate_schema(raw, primera_fila=2):
+    """Validar columnas y filas de un frame crudo antes de normalizarlo.
+
+    Si falta una columna requerida se lanza ValueError. Las filas con AñoMes
+    inválido, dimensiones vacías o medidas vacías, no numéricas o infinitas
+    se descartan y se describen en el reporte de rechazos, con su número de
+    fila en el archivo (primera_fila corresponde al índice 0: la fila 1 es
+    el encabezado). Devuelve las filas válidas, con las medidas ya
+    numéricas, y el reporte {'filas', 'motivos', 'ejemplos'}.
+    """
+    raw = raw.rename(columns=lambda col: str(col).strip())
+    faltantes = [col for col in COLUMNAS_REQUERIDAS if col not in raw.columns]
+    if faltantes:
+        raise ValueError(f"Faltan columnas requeridas: {', '.join(faltantes)}")
     
-    # Calcular variaciones
-    metrics['var_presupuesto'] = {}
-    metrics['var_año_anterior'] = {}
+    # Máscara de filas inválidas por (columna, motivo)
+    problemas = {}
+    if pd.api.types.is_datetime64_any_dtype(raw['AñoMes']):
+        problemas[('AñoMes', 'vacío')] = raw['AñoMes'].isna()
+    else:
+        año_mes = raw['AñoMes'].astype(str).str.strip().str[:7]
+        valido = año_mes.str.fullmatch(r'\d{4}-(0[1-9]|1[0-2])').fillna(False).astype(bool)
+        problemas[('AñoMes', 'formato inválido (se espera YYYY-MM)')] = ~valido
+    for col in DIMENSIONES:
+        problemas[(col, 'vacío')] = raw[col].isna() | (raw[col].astype(str).str.strip() == '')
+    medidas = {}
+    for col in MEDIDAS:
+        medidas[col] = pd.to_numeric(raw[col], errors='coerce')
+        vacio = raw[col].isna()
+        problemas[(col, 'vacío')] = vacio
+        problemas[(col, 'no numérico')] = medidas[col].isna() & ~vacio
+        problemas[(col, 'no finito')] = np.isinf(medidas[col].to_numpy(dtype=np.float64, na_value=0))
     
-    for key in ['trx', 'ingresos', 'recaudacion']:
-        # Variación vs Presupuesto
-        if metrics['presupuesto_2025'][key] > 0:
-            metrics['var_presupuesto'][key] = ((metrics['real_2025'][key] - metrics['presupuesto_2025'][key]) / metrics['presupuesto_2025'][key]) * 100
+    rechazada = np.zeros(len(raw), dtype=bool)
+    reporte = _empty_rejections()
+    for (col, motivo), mask in problemas.items():
+        mask = np.asarray(mask, dtype=bool)
+        if not mask.any():
+            continue
+        rechazada |= mask
+        reporte['motivos'][f"{col}: {motivo}"] = int(mask.sum())
+        reporte['ejemplos'] += [{'fila': int(raw.index[pos]) + primera_fila, 'columna': col,
+                                 'valor': '' if pd.isna(raw[col].iloc[pos]) else str(raw[col].iloc[pos]),
+                                 'motivo': motivo}
+                                for pos in np.flatnonzero(mask)[:MAX_EJEMPLOS_RECHAZO]]
+    reporte['filas'] = int(rechazada.sum())
+    reporte['ejemplos'] = sorted(reporte['ejemplos'], key=lambda e: e['fila'])[:MAX_EJEMPLOS_RECHAZO]
+    validas = raw.assign(**medidas)
+    return (validas.loc[~rechazada] if reporte['filas'] else validas), reporte
+
+def merge_rejections(reportes):
+    """Combinar los reportes de rechazos de varios bloques de un mismo archivo"""
+    total = _empty_rejections()
+    for reporte in reportes:
+        total['filas'] += reporte['filas']
+        for motivo, n in reporte['motivos'].items():
+            total['motivos'][motivo] = total['motivos'].get(motivo, 0) + n
+        if len(total['ejemplos']) < MAX_EJEMPLOS_RECHAZO:
+            total['ejemplos'] += reporte['ejemplos'][:MAX_EJEMPLOS_RECHAZO - len(total['ejemplos'])]
+    return total
+
+def check_valid_rows(df, rechazos):
+    """Error con el resumen de motivos si la validación descartó todas las filas"""
+    if len(df) == 0 and rechazos['filas']:
+        detalle = '; '.join(f"{motivo} ({n})" for motivo, n in rechazos['motivos'].items())
+        raise ValueError(f"Ninguna fila es válida: {detalle}")
+
+def compact_dtype(valores):
+    """Tipo más chico que representa todos los valores sin pérdida ni desborde"""
+    if len(valores) == 0:
+        return valores.dtype
+    if valores.dtype.kind == 'f':
+        # Los montos enteros que Excel lee como float se guardan como enteros si son exactos
+        minimo, maximo = valores.min(), valores.max()
+        if not (abs(minimo) < 2 ** 53 and abs(maximo) < 2 ** 53 and np.array_equal(valores, np.trunc(valores))):
+            return np.float32 if np.array_equal(valores.astype(np.float32), valores) else np.float64
+        valores = np.array([minimo, maximo], dtype=np.int64)
+    elif valores.dtype.kind not in 'iu':
+        return valores.dtype
+    minimo, maximo = int(valores.min()), int(valores.max())
+    for tipo in TIPOS_ENTEROS:
+        info = np.iinfo(tipo)
+        if info.min <= minimo and maximo <= info.max:
+            return tipo
+    return valores.dtype
+
+def downcast_measures(df, medidas=MEDIDAS):
+    """Llevar cada medida al tipo más chico que la representa exactamente.
+
+    Las sumas no desbordan: groupby pasa a int64 cuando el total no entra
+    en el tipo de la columna, group_sums acumula en float64 y build_cube
+    suma en float64 las medidas float32.
+    """
+    for col in medidas:
+        tipo = compact_dtype(df[col].to_numpy())
+        if df[col].dtype != tipo:
+            df[col] = df[col].to_numpy().astype(tipo)
+    return df
+
+def prepare_dataset(raw):
+    """Validar, normalizar y compactar un frame crudo; el reporte de rechazos queda en attrs"""
+    validas, rechazos = validate_schema(raw)
+    check_valid_rows(validas, rechazos)
+    df = downcast_measures(normalize_data(validas))
+    # attrs viaja con el frame hasta make_entry y se guarda en la caché en Parquet
+    df.attrs['rechazos'] = rechazos
+    return df
+
+def extra_dimensions(df):
+    """Columnas de texto adicionales del archivo que se usan como dimensiones de filtro"""
+    extras = []
+    for col in df.columns:
+        if col in COLUMNAS_REQUERIDAS or col in ('Periodo', 'Año', 'Mes'):
+            continue
+        serie = df[col]
+        if isinstance(serie.dtype, pd.CategoricalDtype):
+            distintos = len(serie.cat.categories)
+        elif pd.api.types.is_numeric_dtype(serie) or pd.api.types.is_datetime64_any_dtype(serie):
+            continue
         else:
-            metrics['var_presupuesto'][key] = 0
-            
-        # Variación vs Año Anterior
-        if metrics['real_2024'][key] > 0:
-            metrics['var_año_anterior'][key] = ((metrics['real_2025'][key] - metrics['real_2024'][key]) / metrics['real_2024'][key]) * 100
+            distintos = serie.nunique()
+        if distintos <= MAX_VALORES_FILTRO:
+            extras.append(col)
+    return extras
+
+def filter_dimensions(df):
+    """Dimensiones de filtro del dataset: las fijas más las columnas adicionales"""
+    return list(FILTROS) + extra_dimensions(df)
+
+def hash_bytes(data):
+    """Calcular hash del contenido de un archivo"""
+    return hashlib.sha256(data).hexdigest()
+
+def _cache_path(dataset_hash):
+    return CACHE_DIR / f"{dataset_hash}.v{CACHE_VERSION}.parquet"
+
+def read_cached_dataset(dataset_hash):
+    """Leer dataset normalizado desde la caché en disco"""
+    path = _cache_path(dataset_hash)
+    if not path.exists():
+        return None
+    try:
+        df = pd.read_parquet(path)
+    except Exception:
+        # Archivo corrupto o incompleto: se descarta y se vuelve a parsear
+        path.unlink(missing_ok=True)
+        return None
+    # Actualizar mtime para que la expulsión LRU lo considere reciente
+    os.utime(path)
+    return df
+
+def _replace_atomically(path, escribir):
+    """Escribir path con escribir(ruta) en un temporal único y reemplazarlo de una vez.
+
+    Cada escritura usa su propio temporal: dos sesiones que guardan el mismo
+    dataset a la vez no se pisan y la última en reemplazar gana.
+    """
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    with tempfile.NamedTemporaryFile(dir=CACHE_DIR, prefix=path.name, suffix='.tmp', delete=False) as tmp:
+        tmp_path = Path(tmp.name)
+    try:
+        escribir(tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+def write_cached_dataset(dataset_hash, df):
+    """Guardar dataset normalizado en la caché en disco"""
+    _replace_atomically(_cache_path(dataset_hash), lambda ruta: df.to_parquet(ruta, index=False))
+    evict_cache()
+
+def _manifest_path(dataset_hash):
+    return CACHE_DIR / f"{dataset_hash}.v{CACHE_VERSION}.json"
+
+def read_append_manifest(dataset_hash):
+    """Leer el manifiesto de un dataset armado agregando períodos, o None si no es uno"""
+    path = _manifest_path(dataset_hash)
+    try:
+        return json.loads(path.read_text())
+    except (OSError, ValueError):
+        return None
+
+def write_append_manifest(dataset_hash, base_hash, parte_hash):
+    """Guardar el dataset agregado como base + parte nueva, sin reescribir la historia.
+
+    La parte es el archivo nuevo ya normalizado, que la ingesta guarda en la
+    caché con su propio hash; al cargar se rearma la cadena de agregados.
+    """
+    manifiesto = json.dumps({'base': base_hash, 'parte': parte_hash})
+    _replace_atomically(_manifest_path(dataset_hash), lambda ruta: ruta.write_text(manifiesto))
+
+def evict_cache(max_bytes=CACHE_MAX_BYTES):
+    """Expulsar los datasets menos usados hasta respetar el tamaño máximo"""
+    files = sorted(CACHE_DIR.glob('*.parquet'), key=lambda p: p.stat().st_mtime)
+    total = sum(p.stat().st_size for p in files)
+    # Nunca se expulsa el más reciente, aunque supere el límite por sí solo
+    while total > max_bytes and len(files) > 1:
+        oldest = files.pop(0)
+        total -= oldest.stat().st_size
+        oldest.unlink(missing_ok=True)
+    # Los manifiestos cuya parte ya se expulsó no se pueden rearmar
+    for manifiesto in CACHE_DIR.glob('*.json'):
+        parte = read_append_manifest(manifiesto.name.split('.')[0])
+        if parte is None or not _cache_path(parte['parte']).exists():
+            manifiesto.unlink(missing_ok=True)
+
+def _is_csv(filename):
+    return filename.lower().endswith('.csv')
+
+def parse_uploaded_bytes(data, dataset_hash, filename):
+    """Parsear archivo Excel o CSV usando la caché en disco por contenido"""
+    df = read_cached_dataset(dataset_hash)
+    if df is None:
+        raw = pd.read_csv(io.BytesIO(data)) if _is_csv(filename) else pd.read_excel(io.BytesIO(data))
+        df = prepare_dataset(raw)
+        write_cached_dataset(dataset_hash, df)
+    return df
+
+def _iter_excel_chunks(data, chunk_rows):
+    """Leer la primera hoja de un .xlsx en bloques de filas, sin cargarla entera"""
+    import openpyxl
+    wb = openpyxl.load_workbook(io.BytesIO(data), read_only=True, data_only=True)
+    try:
+        ws = wb.worksheets[0]
+        total = ws.max_row or 0
+        filas = ws.iter_rows(values_only=True)
+        encabezado = [str(c).strip() if c is not None else '' for c in next(filas, [])]
+        bloque = []
+        leidas = 0
+        for fila in filas:
+            bloque.append(fila)
+            if len(bloque) >= chunk_rows:
+                # El índice sigue la posición en la hoja, como en los bloques de CSV
+                yield pd.DataFrame(bloque, columns=encabezado, index=range(leidas, leidas + len(bloque))), \
+                    ((leidas + len(bloque)) / total if total else None)
+                leidas += len(bloque)
+                bloque = []
+        if bloque:
+            yield pd.DataFrame(bloque, columns=encabezado, index=range(leidas, leidas + len(bloque))), 1.0
+    finally:
+        wb.close()
+
+def _iter_csv_chunks(data, chunk_rows):
+    """Leer un CSV en bloques de filas"""
+    buffer = io.BytesIO(data)
+    for chunk in pd.read_csv(buffer, chunksize=chunk_rows):
+        # El avance se estima por bytes consumidos del buffer
+        yield chunk, min(buffer.tell() / max(len(data), 1), 1.0)
+
+def iter_file_chunks(data, filename, chunk_rows=STREAM_CHUNK_ROWS):
+    """Bloques (frame, avance) de un archivo .xlsx o .csv, sin cargarlo entero"""
+    if _is_csv(filename):
+        return _iter_csv_chunks(data, chunk_rows)
+    if filename.lower().endswith('.xlsx'):
+        return _iter_excel_chunks(data, chunk_rows)
+    raise ValueError("La ingesta por streaming admite archivos .xlsx y .csv")
+
+def clean_chunk(chunk, columnas=None):
+    """Validar y normalizar un bloque crudo; devuelve el bloque y su reporte de rechazos.
+
+    columnas limita las columnas que se conservan.
+    """
+    validas, rechazos = validate_schema(chunk)
+    return normalize_data(validas if columnas is None else validas[columnas]), rechazos
+
+def _aggregate_chunk(chunk):
+    """Normalizar un bloque y reducirlo a las claves del cubo"""
+    chunk, rechazos = clean_chunk(chunk, COLUMNAS_REQUERIDAS)
+    partial = _cube_sums(chunk, CUBE_KEYS[1:])
+    # Las categorías cambian entre bloques: se pasan a texto para poder combinarlos
+    for col in DIMENSIONES:
+        partial[col] = partial[col].astype(str)
+    return partial, rechazos
+
+def _combine_partials(partials):
+    return pd.concat(partials, ignore_index=True).groupby(CUBE_KEYS, as_index=False, sort=False)[MEDIDAS].sum()
+
+def stream_aggregate_bytes(data, filename, progress=None, chunk_rows=STREAM_CHUNK_ROWS):
+    """Agregar un archivo por bloques directamente al nivel del cubo.
+
+    Las filas crudas nunca están todas en memoria: cada bloque se reduce a
+    sus sumas por (Periodo, Tipo, Tipo_Operacion, Tipo_Canal) y los parciales
+    se compactan periódicamente, así que la memoria depende de la cantidad
+    de combinaciones y no de la cantidad de filas. Las columnas adicionales
+    del archivo se descartan.
+    """
+    partials, rechazos = [], []
+    for chunk, avance in iter_file_chunks(data, filename, chunk_rows):
+        partial, rechazos_bloque = _aggregate_chunk(chunk)
+        partials.append(partial)
+        rechazos.append(rechazos_bloque)
+        if len(partials) >= STREAM_MAX_PARTIALS:
+            partials = [_combine_partials(partials)]
+        if progress is not None and avance is not None:
+            progress(avance)
+    if not partials:
+        raise ValueError("El archivo no tiene filas de datos")
+    rechazos = merge_rejections(rechazos)
+    agregado = add_period_columns(_combine_partials(partials))
+    check_valid_rows(agregado, rechazos)
+    df = downcast_measures(normalize_data(agregado[COLUMNAS_REQUERIDAS]))
+    df.attrs['rechazos'] = rechazos
+    return df
+
+def stream_uploaded_bytes(data, dataset_hash, filename, progress=None):
+    """Ingesta por streaming usando la caché en disco por contenido"""
+    df = read_cached_dataset(dataset_hash)
+    if df is None:
+        df = stream_aggregate_bytes(data, filename, progress)
+        write_cached_dataset(dataset_hash, df)
+    return df
+
+def compute_period_info(df):
+    """Calcular último mes real y meses disponibles del año en curso"""
+    periodos_reales = df.loc[df['Tipo'] == 'Real', 'Periodo']
+    # Calcular último mes de datos reales
+    ultimo_mes_datos_reales = format_periodo(int(periodos_reales.max())) if len(periodos_reales) else None
+    if ultimo_mes_datos_reales is None:
+        return None, []
+    # Obtener meses disponibles del año del último mes real
+    año_actual = periodo_key(ultimo_mes_datos_reales) // 100
+    meses_actuales = [format_periodo(int(p)) for p in np.unique(periodos_reales[periodos_reales // 100 == año_actual])]
+    return ultimo_mes_datos_reales, meses_actuales
+
+def _cube_sums(df, dimensiones):
+    """Sumas de las medidas por Periodo y dimensiones, en el orden de primera aparición de cada grupo.
+
+    Pasa por grouped_sum, así que con muchas filas se reparte entre los
+    hilos de agregación. AñoMes ya es categórica ordenada por período: se
+    agrupa por sus códigos en vez de factorizar Periodo fila por fila.
+    """
+    por_año_mes = isinstance(df['AñoMes'].dtype, pd.CategoricalDtype)
+    sumas = grouped_sum(df, ['AñoMes' if por_año_mes else 'Periodo'] + dimensiones, MEDIDAS, orden_aparicion=True)
+    if por_año_mes:
+        año_mes = sumas.pop('AñoMes').cat
+        periodos = np.array([periodo_key(v) for v in año_mes.categories], dtype=np.int32)
+        sumas.insert(0, 'Periodo', periodos[año_mes.codes.to_numpy()])
+    return sumas
+
+def build_cube(df):
+    """Construir cubo pre-agregado por mes, tipo, operación, canal y dimensiones adicionales"""
+    # Las filas quedan en el orden en que aparece cada combinación, que es el de las opciones de filtro
+    return add_period_columns(_cube_sums(df, CUBE_KEYS[1:] + extra_dimensions(df)))
+
+class BitmapIndex:
+    """Índice de bitmaps por valor de cada dimensión de filtro.
+
+    Se arma una vez por dataset: para cada valor de cada dimensión guarda
+    las filas que lo contienen como bits empaquetados (np.packbits). Una
+    selección se resuelve con OR entre los valores elegidos de una dimensión
+    y AND entre dimensiones, sobre n/8 bytes, sin volver a recorrer las
+    columnas.
+    """
+
+    def __init__(self, df, dimensiones):
+        self.filas = len(df)
+        self.bitmaps = {}
+        for dim in dimensiones:
+            serie = df[dim]
+            if isinstance(serie.dtype, pd.CategoricalDtype):
+                valores, codigos = serie.cat.categories, serie.cat.codes.to_numpy()
+            else:
+                valores, codigos = np.unique(serie.to_numpy(), return_inverse=True)
+            self.bitmaps[dim] = {
+                valor.item() if isinstance(valor, np.generic) else valor: np.packbits(codigos == i)
+                for i, valor in enumerate(valores)
+            }
+
+    def mask(self, filtros):
+        """Máscara booleana de una selección {dimensión: valores}; sin valores equivale a todos"""
+        resultado = None
+        for dim, valores in filtros.items():
+            if not valores:
+                continue
+            union = np.zeros((self.filas + 7) // 8, dtype=np.uint8)
+            for valor in valores:
+                bits = self.bitmaps[dim].get(valor)
+                if bits is not None:
+                    union |= bits
+            if resultado is None:
+                resultado = union
+            else:
+                resultado &= union
+        if resultado is None:
+            return np.ones(self.filas, dtype=bool)
+        return np.unpackbits(resultado, count=self.filas).view(bool)
+
+def make_entry(df, cube=None, periodos=None, filas=None, rechazos=None):
+    """Armar una entrada del registro; el cubo y los períodos se calculan si no se pasan.
+
+    La entrada guarda las partes normalizadas del dataset: df y, al agregar
+    períodos, cada archivo nuevo (append_to_entry), sin concatenarlas. df es
+    None cuando los datos viven en una base (make_source_entry): la entrada
+    guarda solo el cubo y filas indica el total de la base. El reporte de
+    rechazos de la ingesta se toma de df.attrs si no se pasa.
+    """
+    if rechazos is None and df is not None:
+        rechazos = df.attrs.pop('rechazos', None)
+    if cube is None:
+        cube = build_cube(df)
+    return {
+        'partes': [df] if df is not None else None,
+        'cube': cube,
+        'indice': BitmapIndex(cube, filter_dimensions(cube)),
+        'filas': filas if filas is not None else len(df),
+        'periodos': periodos if periodos is not None else compute_period_info(cube),
+        'rechazos': rechazos,
+        'sesiones': set(),
+    }
+
+def _unify_categories(frames):
+    """Llevar las columnas categóricas de varios frames a categorías comunes"""
+    base = frames[0]
+    for col in base.columns:
+        if not isinstance(base[col].dtype, pd.CategoricalDtype):
+            continue
+        # Las categorías existentes conservan su código; las nuevas se agregan al final
+        categorias = list(base[col].cat.categories)
+        conocidas = set(categorias)
+        for frame in frames[1:]:
+            nuevas = [c for c in frame[col].cat.categories if c not in conocidas]
+            categorias.extend(nuevas)
+            conocidas.update(nuevas)
+        if col == 'AñoMes':
+            categorias.sort(key=periodo_key)
+        dtype = pd.CategoricalDtype(categorias, ordered=base[col].cat.ordered)
+        for frame in frames:
+            frame[col] = frame[col].astype(dtype)
+    return frames
+
+def validate_append(entry, nuevo_df, nuevo_cube):
+    """Validar que los datos nuevos tengan el mismo esquema y no repitan períodos"""
+    columnas = set(entry['partes'][0].columns)
+    faltantes = sorted(columnas - set(nuevo_df.columns))
+    sobrantes = sorted(set(nuevo_df.columns) - columnas)
+    if faltantes or sobrantes:
+        raise ValueError(f"El esquema no coincide con el dataset actual. "
+                         f"Faltan: {faltantes or '-'}; sobran: {sobrantes or '-'}")
+    check_new_periods(period_pairs(entry['cube']), period_pairs(nuevo_cube))
+
+def period_pairs(df):
+    """Pares (Periodo, Tipo) presentes en un frame normalizado o cubo"""
+    return set(zip(df['Periodo'].tolist(), df['Tipo'].astype(str).tolist()))
+
+def check_new_periods(existentes, nuevos):
+    """Error si alguno de los pares (Periodo, Tipo) nuevos ya existe"""
+    repetidos = sorted(existentes & nuevos)
+    if repetidos:
+        detalle = ', '.join(f"{format_periodo(int(p))} ({t})" for p, t in repetidos[:6])
+        raise ValueError(f"Los períodos ya existen en el dataset: {detalle}")
+
+def merge_period_info(periodos, nuevos):
+    """Combinar último mes real y meses del año en curso de dos datasets"""
+    ultimos = [u for u in (periodos[0], nuevos[0]) if u is not None]
+    if not ultimos:
+        return None, []
+    ultimo = max(ultimos)
+    # Si los datos nuevos abren un año, los meses del año anterior dejan de ser los actuales
+    return ultimo, sorted(m for m in set(periodos[1]) | set(nuevos[1]) if m[:4] == ultimo[:4])
+
+def append_to_entry(entry, nuevo_df):
+    """Agregar períodos nuevos a un dataset registrado.
+
+    Solo se parsean y agregan las filas nuevas: su cubo se concatena al
+    existente (los períodos no se superponen, así que no hay que volver a
+    agrupar) y el último mes y los meses del año en curso se actualizan a
+    partir de él. Las filas nuevas se suman a la lista de partes de la
+    entrada, la misma que registra el manifiesto, sin copiar la historia:
+    el costo depende de las filas nuevas y del cubo, no de las filas ya
+    cargadas.
+    """
+    rechazos = nuevo_df.attrs.pop('rechazos', None)
+    nuevo_cube = build_cube(nuevo_df)
+    validate_append(entry, nuevo_df, nuevo_cube)
+    cube, nuevo_cube = _unify_categories([entry['cube'].copy(deep=False), nuevo_cube])
+    nueva = make_entry(
+        None,
+        pd.concat([cube, nuevo_cube[cube.columns]], ignore_index=True),
+        merge_period_info(entry['periodos'], compute_period_info(nuevo_cube)),
+        filas=entry['filas'] + len(nuevo_df),
+        rechazos=rechazos,
+    )
+    nueva['partes'] = entry['partes'] + [nuevo_df[entry['partes'][0].columns]]
+    return nueva
+
+def _sql_name(nombre):
+    """Identificador SQL entre comillas dobles"""
+    return '"' + str(nombre).replace('"', '""') + '"'
+
+def database_engine(ruta):
+    """Motor de una base según la extensión del archivo: 'duckdb' o 'sqlite'"""
+    sufijo = Path(ruta).suffix.lower()
+    if sufijo in EXTENSIONES_DUCKDB:
+        return 'duckdb'
+    if sufijo in EXTENSIONES_SQLITE:
+        return 'sqlite'
+    raise ValueError(f"Extensión de base no soportada: {sufijo or '(sin extensión)'}. "
+                     f"Use {', '.join(EXTENSIONES_DUCKDB + EXTENSIONES_SQLITE)}")
+
+class PandasSource:
+    """Origen de datos en memoria: un frame normalizado que se agrega con grouped_sum"""
+
+    motor = 'pandas'
+
+    def __init__(self, df):
+        self.df = df
+
+    def filas(self):
+        return len(self.df)
+
+    def aggregate(self, claves, medidas=MEDIDAS, filtros=None):
+        """Sumas de medidas por claves de las filas que cumplen los filtros {columna: valores}"""
+        seleccion = None
+        for col, valores in (filtros or {}).items():
+            if valores:
+                en_valores = self.df[col].isin(valores).to_numpy()
+                seleccion = en_valores if seleccion is None else seleccion & en_valores
+        return grouped_sum(self.df, claves, medidas, seleccion)
+
+    def cube(self):
+        return build_cube(self.df)
+
+class SQLSource:
+    """Origen de datos en una base analítica embebida (DuckDB o SQLite) en disco.
+
+    Los filtros y las agrupaciones se traducen a SQL y los resuelve el motor
+    sobre el archivo: al proceso solo llega el resultado agregado, nunca las
+    filas crudas, así que la historia puede ser mucho más grande que la
+    memoria. La tabla guarda las filas normalizadas (ver append) con
+    Periodo, Año y Mes enteros. Cada consulta abre su propia conexión, así
+    que el origen se puede usar desde cualquier hilo.
+    """
+
+    def __init__(self, ruta, tabla=DATA_DB_TABLE):
+        self.ruta = Path(ruta)
+        self.tabla = tabla
+        self.motor = database_engine(ruta)
+
+    def connect(self, solo_lectura=True):
+        if self.motor == 'duckdb':
+            try:
+                import duckdb
+            except ImportError as e:
+                raise ImportError("Las bases .duckdb requieren el paquete duckdb (pip install duckdb)") from e
+            return duckdb.connect(str(self.ruta), read_only=solo_lectura)
+        import sqlite3
+        if solo_lectura:
+            return sqlite3.connect(f"{self.ruta.resolve().as_uri()}?mode=ro", uri=True)
+        return sqlite3.connect(self.ruta)
+
+    def query(self, sql, params=()):
+        """Ejecutar una consulta de lectura y devolver el resultado como DataFrame"""
+        params = [p.item() if isinstance(p, np.generic) else p for p in params]
+        with closing(self.connect()) as con:
+            if self.motor == 'duckdb':
+                return con.execute(sql, params).df()
+            return pd.read_sql_query(sql, con, params=params)
+
+    def version(self):
+        """Clave del dataset en el registro; cambia cada vez que se modifica la base"""
+        estado = self.ruta.stat()
+        return f"{DB_PREFIX}{self.ruta.resolve()}:{estado.st_mtime_ns}:{estado.st_size}"
+
+    def filas(self):
+        return int(self.query(f"SELECT COUNT(*) AS n FROM {_sql_name(self.tabla)}")['n'].iloc[0])
+
+    def extra_dimensions(self):
+        """Columnas de texto adicionales con pocos valores distintos, como extra_dimensions"""
+        muestra = self.query(f"SELECT * FROM {_sql_name(self.tabla)} LIMIT 1000")
+        candidatas = [col for col in muestra.columns
+                      if col not in COLUMNAS_REQUERIDAS and col not in ('Periodo', 'Año', 'Mes')
+                      and not pd.api.types.is_numeric_dtype(muestra[col])]
+        if not candidatas:
+            return []
+        distintos = self.query("SELECT " + ', '.join(
+            f"COUNT(DISTINCT {_sql_name(col)}) AS {_sql_name(col)}" for col in candidatas) +
+            f" FROM {_sql_name(self.tabla)}").iloc[0]
+        return [col for col in candidatas if distintos[col] <= MAX_VALORES_FILTRO]
+
+    def aggregate(self, claves, medidas=MEDIDAS, filtros=None):
+        """Sumas de medidas por claves con los filtros {columna: valores} resueltos en SQL"""
+        condiciones, params = [], []
+        for col, valores in (filtros or {}).items():
+            if valores:
+                condiciones.append(f"{_sql_name(col)} IN ({', '.join('?' * len(valores))})")
+                params.extend(valores)
+        grupo = ', '.join(_sql_name(col) for col in claves)
+        sumas = ', '.join(f"SUM({_sql_name(col)}) AS {_sql_name(col)}" for col in medidas)
+        sql = f"SELECT {grupo}, {sumas} FROM {_sql_name(self.tabla)}"
+        if condiciones:
+            sql += " WHERE " + " AND ".join(condiciones)
+        return self.query(f"{sql} GROUP BY {grupo}", params)
+
+    def cube(self):
+        """Cubo agregado por el motor, con los mismos tipos que build_cube"""
+        cube = self.aggregate(CUBE_KEYS + self.extra_dimensions())
+        return normalize_data(add_period_columns(cube))
+
+    def tables(self):
+        """Nombres de las tablas de la base"""
+        if self.motor == 'duckdb':
+            return set(self.query("SELECT table_name AS name FROM information_schema.tables")['name'])
+        return set(self.query("SELECT name FROM sqlite_master WHERE type = 'table'")['name'])
+
+    def existing_periods(self):
+        """Pares (Periodo, Tipo) ya cargados; vacío si la base o la tabla no existen"""
+        if not self.ruta.exists() or self.tabla not in self.tables():
+            return set()
+        return period_pairs(self.query(f"SELECT DISTINCT Periodo, Tipo FROM {_sql_name(self.tabla)}"))
+
+    @contextmanager
+    def transaction(self):
+        """Conexión de escritura: lo escrito se confirma junto al salir o se descarta si hay un error"""
+        with closing(self.connect(solo_lectura=False)) as con:
+            if self.motor == 'duckdb':
+                con.begin()
+            try:
+                yield con
+            except BaseException:
+                con.rollback()
+                raise
+            con.commit()
+
+    def append(self, df, con=None):
+        """Agregar filas normalizadas a la tabla, creándola si no existe.
+
+        Sin con cada llamada es su propia transacción; con la conexión de
+        transaction() varias llamadas se confirman o se descartan juntas.
+        """
+        if con is None:
+            with self.transaction() as con:
+                return self.append(df, con)
+        # Las categóricas se guardan como texto: las categorías cambian entre cargas
+        plano = pd.DataFrame({col: df[col].astype(str) if isinstance(df[col].dtype, pd.CategoricalDtype)
+                              else df[col] for col in df.columns})
+        tabla = _sql_name(self.tabla)
+        if self.motor == 'duckdb':
+            con.register('filas_nuevas', plano)
+            con.execute(f"CREATE TABLE IF NOT EXISTS {tabla} AS SELECT * FROM filas_nuevas LIMIT 0")
+            con.execute(f"INSERT INTO {tabla} BY NAME SELECT * FROM filas_nuevas")
+            con.unregister('filas_nuevas')
         else:
-            metrics['var_año_anterior'][key] = 0
+            # Inserción manual: to_sql confirma por su cuenta y rompería la transacción
+            tipos = {'i': 'INTEGER', 'u': 'INTEGER', 'b': 'INTEGER', 'f': 'REAL'}
+            columnas = ', '.join(f"{_sql_name(col)} {tipos.get(plano[col].dtype.kind, 'TEXT')}" for col in plano.columns)
+            con.execute(f"CREATE TABLE IF NOT EXISTS {tabla} ({columnas})")
+            con.executemany(f"INSERT INTO {tabla} ({', '.join(_sql_name(col) for col in plano.columns)}) "
+                            f"VALUES ({', '.join('?' * len(plano.columns))})",
+                            zip(*(plano[col].tolist() for col in plano.columns)))
+
+    def drop(self):
+        """Borrar la tabla con todas sus filas"""
+        with closing(self.connect(solo_lectura=False)) as con:
+            con.execute(f"DROP TABLE IF EXISTS {_sql_name(self.tabla)}")
+            con.commit()
+
+def database_source(ruta=DATA_DB_PATH):
+    """Origen de la base configurada en DASHBOARD_DB, o None si no hay una"""
+    if not ruta or not Path(ruta).exists():
+        return None
+    return SQLSource(ruta)
+
+def make_source_entry(source):
+    """Armar una entrada del registro desde un origen de datos; la de una base no guarda filas crudas"""
+    df = source.df if isinstance(source, PandasSource) else None
+    return make_entry(df, source.cube(), filas=source.filas())
+
+def default_dataset_hash():
+    """Dataset inicial de cada sesión: la base configurada si existe, si no los datos de ejemplo"""
+    source = database_source()
+    return source.version() if source is not None else SAMPLE_HASH
+
+class DatasetRegistry:
+    """Registro de datasets compartido por todas las sesiones del proceso.
+
+    Cada dataset se guarda una sola vez por hash de contenido junto con su
+    cubo, y lleva la cuenta de las sesiones que lo están usando. Cuando
+    ninguna sesión lo referencia se expulsa. Los datasets registrados son
+    inmutables: ninguna sesión debe modificarlos.
+    """
+
+    def __init__(self, session_ttl=SESSION_TTL_SECONDS):
+        self.session_ttl = session_ttl
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._loading = {}
+        self._session_hashes = {}
+        self._session_seen = {}
+
+    def acquire(self, dataset_hash, session_id, loader):
+        """Obtener el dataset para una sesión, cargándolo con loader si no está registrado.
+
+        loader devuelve un DataFrame normalizado, una entrada ya armada con
+        make_entry o None si el dataset no se puede cargar.
+        """
+        with self._lock:
+            entry = self._entries.get(dataset_hash)
+        if entry is None:
+            # La carga se hace fuera del lock general para no bloquear a las demás sesiones,
+            # pero con un lock por hash: dos sesiones con el mismo archivo lo parsean una vez
+            with self._lock:
+                carga = self._loading.setdefault(dataset_hash, threading.Lock())
+            with carga:
+                with self._lock:
+                    entry = self._entries.get(dataset_hash)
+                if entry is None:
+                    nueva = loader()
+                    if isinstance(nueva, pd.DataFrame):
+                        nueva = make_entry(nueva)
+                    with self._lock:
+                        if nueva is not None:
+                            entry = self._entries.setdefault(dataset_hash, nueva)
+                        # Si la carga falla el lock queda libre y se reutiliza en el próximo intento
+                        self._loading.pop(dataset_hash, None)
+                    if entry is None:
+                        return None
+        with self._lock:
+            anterior = self._session_hashes.get(session_id)
+            if anterior is not None and anterior != dataset_hash:
+                self._release(anterior, session_id)
+            entry['sesiones'].add(session_id)
+            self._entries.setdefault(dataset_hash, entry)
+            self._session_hashes[session_id] = dataset_hash
+            self._session_seen[session_id] = time.time()
+            self._purge_inactive_sessions()
+        return entry
+
+    def stats(self):
+        """Resumen de datasets registrados y sesiones que los usan"""
+        with self._lock:
+            return {h: len(e['sesiones']) for h, e in self._entries.items()}
+
+    def _release(self, dataset_hash, session_id):
+        entry = self._entries.get(dataset_hash)
+        if entry is None:
+            return
+        entry['sesiones'].discard(session_id)
+        if not entry['sesiones']:
+            del self._entries[dataset_hash]
+
+    def _purge_inactive_sessions(self):
+        # Streamlit no avisa cuando se cierra una sesión: se liberan las que ya no
+        # están activas en el runtime o que no se vieron durante session_ttl
+        ahora = time.time()
+        for session_id, visto in list(self._session_seen.items()):
+            activa = ahora - visto < self.session_ttl
+            if activa and st.runtime.exists():
+                activa = st.runtime.get_instance().is_active_session(session_id)
+            if not activa:
+                self._release(self._session_hashes.pop(session_id), session_id)
+                del self._session_seen[session_id]
+
+@st.cache_resource
+def get_registry():
+    """Registro de datasets único para todo el proceso"""
+    return DatasetRegistry()
+
+def get_session_id():
+    """Identificador de la sesión de Streamlit actual"""
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx is not None else 'local'
+
+def _load_registered_dataset(dataset_hash):
+    """Cargar un dataset por hash: datos de ejemplo, base de datos o caché en disco"""
+    if dataset_hash == SAMPLE_HASH:
+        return prepare_dataset(create_sample_data())
+    if dataset_hash.startswith(DB_PREFIX):
+        source = database_source()
+        # La base cambió desde que se registró esta versión: se descarta
+        if source is None or source.version() != dataset_hash:
+            return None
+        try:
+            return make_source_entry(source)
+        except Exception as e:
+            st.sidebar.error(f"No se pudo leer la base {source.ruta.name} ({source.motor}): {e}")
+            return None
+    manifiesto = read_append_manifest(dataset_hash)
+    if manifiesto is not None:
+        return _load_appended_dataset(manifiesto)
+    return read_cached_dataset(dataset_hash)
+
+def _load_appended_dataset(manifiesto):
+    """Rearmar un dataset agregado a partir de su base y la parte nueva"""
+    base = _load_registered_dataset(manifiesto['base'])
+    parte = read_cached_dataset(manifiesto['parte'])
+    if base is None or parte is None:
+        return None
+    return append_to_entry(base if isinstance(base, dict) else make_entry(base), parte)
+
+def _uploaded_file_loader(uploaded_file, streaming, progress):
+    """Devolver hash y función de carga del archivo subido"""
+    data = uploaded_file.getvalue()
+    dataset_hash = hash_bytes(data)
+    if streaming:
+        # El resultado agregado es otro dataset que el parseo completo del mismo archivo
+        dataset_hash += '-agregado'
+        return dataset_hash, lambda: stream_uploaded_bytes(data, dataset_hash, uploaded_file.name, progress)
+    return dataset_hash, lambda: parse_uploaded_bytes(data, dataset_hash, uploaded_file.name)
+
+def load_uploaded_file(uploaded_file, streaming=False, progress=None):
+    """Registrar el archivo subido en el registro compartido y devolver su hash"""
+    dataset_hash, loader = _uploaded_file_loader(uploaded_file, streaming, progress)
+    get_registry().acquire(dataset_hash, get_session_id(), loader)
+    return dataset_hash
+
+def append_uploaded_file(uploaded_file, base_hash, streaming=False, progress=None):
+    """Agregar los períodos del archivo subido al dataset actual y devolver el nuevo hash"""
+    nuevo_hash, loader = _uploaded_file_loader(uploaded_file, streaming, progress)
+    registry = get_registry()
+    session_id = get_session_id()
+    base = registry.acquire(base_hash, session_id, lambda: _load_registered_dataset(base_hash))
+    if base is None:
+        raise ValueError("El dataset actual ya no está disponible; vuelva a cargarlo")
+    if base['partes'] is None:
+        raise ValueError("El dataset actual es una base de datos: los períodos nuevos se cargan "
+                         "en la base con cargar_base.py")
+    dataset_hash = hash_bytes(f"{base_hash}+{nuevo_hash}".encode())
+
+    def merge():
+        entry = append_to_entry(base, loader())
+        # Para sobrevivir a un reinicio se persiste solo el enlace base + parte: la parte
+        # ya quedó en la caché al parsearla, así que el costo no crece con la historia
+        write_append_manifest(dataset_hash, base_hash, nuevo_hash)
+        return entry
+
+    registry.acquire(dataset_hash, session_id, merge)
+    return dataset_hash
+
+@instrumented('carga')
+def load_data():
+    """Cargar datos desde archivo o usar datos de ejemplo"""
+    # La sesión solo guarda el hash; el dataset vive en el registro compartido
+    por_defecto = default_dataset_hash()
+    dataset_hash = st.session_state.setdefault('dataset_hash', por_defecto)
+    entry = get_registry().acquire(dataset_hash, get_session_id(),
+                                   lambda: _load_registered_dataset(dataset_hash))
+    if entry is None:
+        # El dataset fue expulsado del registro y de la caché en disco, o la base cambió
+        # o no se puede leer; si falló la base por defecto se usan los datos de ejemplo
+        st.session_state.dataset_hash = por_defecto if dataset_hash != por_defecto else SAMPLE_HASH
+        st.session_state.pop('upload_id', None)
+        return load_data()
+    ultimo_mes_datos_reales, meses_actuales = entry['periodos']
+    return entry['filas'], entry['cube'], entry['indice'], ultimo_mes_datos_reales, meses_actuales, entry['rechazos']
+
+class MemoCache:
+    """Caché LRU con expiración para métricas y figuras ya calculadas.
+
+    Las claves empiezan por el hash del dataset (view_key). Las entradas
+    precalculadas (warm) se guardan aparte, fijas por dataset: no vencen ni
+    las expulsa el LRU de las demás vistas, y se liberan con release cuando
+    el dataset sale del registro. Entre todos los datasets no pasan de
+    max_fijas; al superarlo se expulsan datasets enteros, el usado hace más
+    tiempo primero. Fijas y vistas sueltas juntas no pasan de max_entries.
+    """
+
+    def __init__(self, max_entries=MEMO_MAX_ENTRIES, ttl=MEMO_TTL_SECONDS, max_fijas=PRECOMPUTE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_fijas = max_fijas
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._data = OrderedDict()
+        self._fijas = OrderedDict()
+        self._n_fijas = 0
+
+    def get(self, key):
+        """Devolver (encontrado, valor) y actualizar los contadores"""
+        with self._lock:
+            fijas = self._fijas.get(key[0], {})
+            if key in fijas:
+                self._fijas.move_to_end(key[0])
+                self.hits += 1
+                return True, fijas[key]
+            item = self._data.get(key)
+            if item is not None and time.time() - item[0] < self.ttl:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return True, item[1]
+            if item is not None:
+                del self._data[key]
+            self.misses += 1
+            return False, None
+
+    def put(self, key, value):
+        """Guardar un valor, expulsando el menos usado si se supera el tamaño"""
+        with self._lock:
+            self._data[key] = (time.time(), value)
+            self._data.move_to_end(key)
+            self._trim()
+
+    def _trim(self):
+        """Expulsar datasets fijos y vistas sueltas hasta respetar los tamaños; se llama con el lock tomado"""
+        # El dataset usado más recientemente (el último) nunca se expulsa
+        while self._n_fijas > self.max_fijas and len(self._fijas) > 1:
+            _, expulsadas = self._fijas.popitem(last=False)
+            self._n_fijas -= len(expulsadas)
+        while self._data and len(self._data) + self._n_fijas > self.max_entries:
+            self._data.popitem(last=False)
+
+    def get_or_compute(self, key, compute):
+        """Devolver el valor cacheado o calcularlo y guardarlo"""
+        found, value = self.get(key)
+        if not found:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def warm(self, key, compute):
+        """Fijar un valor para su dataset, calculándolo si falta, sin tocar los contadores; True si se calculó"""
+        with self._lock:
+            fijas = self._fijas.setdefault(key[0], {})
+            self._fijas.move_to_end(key[0])
+            if key in fijas:
+                return False
+            # Si ya estaba en la parte LRU se mueve a las fijas sin recalcular
+            item = self._data.pop(key, None)
+        vigente = item is not None and time.time() - item[0] < self.ttl
+        value = item[1] if vigente else compute()
+        with self._lock:
+            fijas = self._fijas.get(key[0])
+            # El dataset pudo salir del registro, o de las fijas, mientras se calculaba
+            if fijas is not None and key not in fijas:
+                fijas[key] = value
+                self._n_fijas += 1
+                self._trim()
+        return not vigente
+
+    def release(self, dataset_hash):
+        """Liberar las entradas fijas de un dataset"""
+        with self._lock:
+            self._n_fijas -= len(self._fijas.pop(dataset_hash, {}))
+
+    def coverage(self, keys):
+        """Cantidad de claves con un valor vigente en la caché"""
+        ahora = time.time()
+        with self._lock:
+            return sum(1 for key in keys
+                       if key in self._fijas.get(key[0], {}) or
+                       (key in self._data and ahora - self._data[key][0] < self.ttl))
+
+    def stats(self):
+        """Contadores de aciertos, fallos y entradas"""
+        with self._lock:
+            return {'aciertos': self.hits, 'fallos': self.misses, 'entradas': len(self._data) + self._n_fijas}
+
+@st.cache_resource
+def get_memo_cache():
+    """Caché de vistas única para todo el proceso"""
+    return MemoCache()
+
+def get_cached_figure(memo, key, builder):
+    """Obtener una figura desde la caché, donde se guarda como JSON, o construirla"""
+    fig_json = memo.get_or_compute(key, lambda: builder().to_json())
+    import plotly.io as pio
+    return pio.from_json(fig_json, skip_invalid=True)
+
+@st.cache_resource
+def get_aggregation_pool(workers):
+    """Pool de hilos de agregación, uno por cantidad de workers para todo el proceso"""
+    return ThreadPoolExecutor(max_workers=workers, thread_name_prefix='agregacion')
+
+def _block_group_sums(codigos, tamaños, columnas, seleccion, contar, primera, inicio, fin):
+    """Sumas por grupo de las filas [inicio, fin), seguidas de los conteos y la primera fila de cada grupo"""
+    n_grupos = int(np.prod(tamaños))
+    grupo = np.zeros(fin - inicio, dtype=np.int64)
+    descartar = np.zeros(fin - inicio, dtype=bool) if seleccion is None else ~seleccion[inicio:fin]
+    for codigo, tamaño in zip(codigos, tamaños):
+        bloque = codigo[inicio:fin]
+        descartar |= bloque < 0
+        grupo = grupo * tamaño + bloque
+    # Las filas excluidas van a un grupo extra que se descarta al final
+    grupo[descartar] = n_grupos
+    sumas = [np.bincount(grupo, weights=columna[inicio:fin], minlength=n_grupos + 1)[:n_grupos]
+             for columna in columnas]
+    if contar:
+        sumas.append(np.bincount(grupo, minlength=n_grupos + 1)[:n_grupos])
+    if primera:
+        # Los grupos sin filas en el bloque quedan en infinito
+        primeras = np.full(n_grupos + 1, np.inf)
+        np.minimum.at(primeras, grupo, np.arange(inicio, fin, dtype=np.float64))
+        sumas.append(primeras[:n_grupos])
+    return np.vstack(sumas) if sumas else np.empty((0, n_grupos))
+
+def group_sums(codigos, tamaños, columnas, seleccion=None, contar=False, workers=None, primera=False):
+    """Sumar columnas por la combinación de varios códigos enteros.
+
+    codigos son arrays de códigos 0..tamaño-1 (negativo excluye la fila) y el
+    grupo es su combinación en base mixta. Devuelve una matriz con una fila
+    por columna (más los conteos si contar, y la primera fila de cada grupo,
+    infinito si no tiene, si primera) y una columna por grupo. Con más
+    de PARALLEL_MIN_ROWS filas el rango se parte en bloques que suman hilos
+    del pool sobre los mismos arrays, sin copiarlos (bincount libera el GIL),
+    y los parciales se suman al final.
+    """
+    n_filas = len(codigos[0])
+    workers = workers or PARALLEL_WORKERS
+    if n_filas < PARALLEL_MIN_ROWS or workers <= 1:
+        return _block_group_sums(codigos, tamaños, columnas, seleccion, contar, primera, 0, n_filas)
+    bordes = list(range(0, n_filas, PARALLEL_BLOCK_ROWS)) + [n_filas]
+    parciales = list(get_aggregation_pool(workers).map(
+        lambda rango: _block_group_sums(codigos, tamaños, columnas, seleccion, contar, primera, *rango),
+        zip(bordes[:-1], bordes[1:])))
+    total = sum(parciales)
+    if primera:
+        total[-1] = np.min([parcial[-1] for parcial in parciales], axis=0)
+    return total
+
+def grouped_sum(df, claves, medidas=MEDIDAS, seleccion=None, workers=None, orden_aparicion=False):
+    """Equivalente a df[seleccion].groupby(claves, observed=True)[medidas].sum().reset_index()
+
+    Con orden_aparicion los grupos quedan en el orden de su primera fila,
+    como groupby(..., sort=False), en vez del orden de las claves.
+    """
+    # Las claves de texto (el cubo guarda AñoMes como texto) se codifican con categorías ordenadas
+    series = [df[clave] if isinstance(df[clave].dtype, pd.CategoricalDtype) else df[clave].astype('category')
+              for clave in claves]
+    categoricas = [serie.cat for serie in series]
+    tamaños = [len(cat.categories) for cat in categoricas]
+    if np.prod(tamaños, dtype=np.float64) > PARALLEL_MAX_GROUPS:
+        datos = df if seleccion is None else df.loc[seleccion]
+        return datos.groupby(claves, observed=True, sort=not orden_aparicion)[medidas].sum().reset_index()
+    matriz = group_sums([cat.codes.to_numpy() for cat in categoricas], tamaños,
+                        [df[col].to_numpy() for col in medidas], seleccion, contar=True, workers=workers,
+                        primera=orden_aparicion)
+    # Solo los grupos con filas, como observed=True
+    presentes = np.flatnonzero(matriz[len(medidas)])
+    if orden_aparicion:
+        presentes = presentes[np.argsort(matriz[-1][presentes], kind='stable')]
+    resultado = {}
+    resto = presentes
+    for clave, serie, tamaño in reversed(list(zip(claves, series, tamaños))):
+        resultado[clave] = pd.Categorical.from_codes(resto % tamaño, dtype=serie.dtype)
+        resto = resto // tamaño
+    resultado = {clave: resultado[clave] for clave in claves}
+    for col, fila in zip(medidas, matriz):
+        entero = pd.api.types.is_integer_dtype(df[col].dtype)
+        resultado[col] = fila[presentes].astype(np.int64 if entero else np.float64)
+    return pd.DataFrame(resultado)
+
+def view_key(dataset_hash, filtros, ultimo_mes_datos_reales, años_referencia):
+    """Clave de una vista en la caché: dataset, filtros, último mes y años de referencia"""
+    seleccion = tuple(sorted((dim, tuple(sorted(valores, key=str))) for dim, valores in filtros.items() if valores))
+    return (dataset_hash, seleccion, ultimo_mes_datos_reales, tuple(sorted(años_referencia)))
+
+def filter_options(cube):
+    """Opciones de cada dimensión de filtro, en el orden en que aparecen en el cubo"""
+    opciones = {dim: list(cube[dim].unique()) for dim in filter_dimensions(cube)}
+    opciones['Mes'] = sorted(int(m) for m in opciones['Mes'])
+    return opciones
+
+def reference_year_options(cube, ultimo_mes_datos_reales):
+    """Años de referencia disponibles y los seleccionados por defecto para un último mes"""
+    año_actual = periodo_key(ultimo_mes_datos_reales) // 100
+    disponibles = sorted((int(a) for a in cube['Año'].unique() if a < año_actual), reverse=True)
+    return disponibles, [a for a in default_reference_years(ultimo_mes_datos_reales) if a in disponibles]
+
+def build_filter_mask(df, operacion='Todos', canal='Todos', mes='Todos'):
+    """Combinar los filtros seleccionados en una única máscara booleana"""
+    mask = np.ones(len(df), dtype=bool)
+    if operacion != 'Todos':
+        mask &= (df['Tipo_Operacion'] == operacion).to_numpy()
+    if canal != 'Todos':
+        mask &= (df['Tipo_Canal'] == canal).to_numpy()
+    if mes != 'Todos':
+        mask &= df['Mes'].to_numpy() == int(mes)
+    return mask
+
+def default_reference_years(ultimo_mes_datos_reales):
+    """Años de referencia por defecto: solo el año anterior"""
+    return [periodo_key(ultimo_mes_datos_reales) // 100 - 1]
+
+def _ratio(numerador, denominador, factor=1.0):
+    """Dividir arrays devolviendo 0 donde el denominador no es positivo"""
+    numerador = np.asarray(numerador, dtype=float)
+    denominador = np.asarray(denominador, dtype=float)
+    return np.divide(numerador * factor, denominador, out=np.zeros_like(numerador), where=denominador > 0)
+
+def compare_years(df, ultimo_mes_datos_reales, años_referencia=None, mask=None):
+    """Comparar el acumulado del año actual contra su presupuesto y N años de referencia.
+
+    El año actual es el de ultimo_mes_datos_reales y todos los años se cortan
+    en ese mismo mes. Los totales de todos los años y tipos salen de una sola
+    pasada agrupada (group_sums por año y tipo) y las variaciones se calculan
+    de forma vectorizada. Devuelve un frame ordenado con una fila por
+    escenario: Real y Presupuesto del año actual y Real de cada año de
+    referencia, del más reciente al más antiguo.
+    """
+    ultimo_periodo = periodo_key(ultimo_mes_datos_reales)
+    año_actual = ultimo_periodo // 100
+    if años_referencia is None:
+        años_referencia = default_reference_years(ultimo_mes_datos_reales)
+    años = np.array([año_actual] + sorted(set(años_referencia) - {año_actual}, reverse=True), dtype=np.int64)
+    
+    # Posición de cada fila en la tabla (año, tipo); -1 si no participa
+    tipos = df['Tipo'].cat
+    n_tipos = len(tipos.categories)
+    tabla_años = np.full(años.max() - años.min() + 1, -1)
+    tabla_años[años - años.min()] = np.arange(len(años))
+    año_col = df['Año'].to_numpy().astype(np.int64)
+    en_rango = (año_col >= años.min()) & (año_col <= años.max())
+    idx_año = np.where(en_rango, tabla_años[np.clip(año_col - años.min(), 0, len(tabla_años) - 1)], -1)
+    seleccion = (idx_año >= 0) & (df['Mes'].to_numpy() <= ultimo_periodo % 100) & (tipos.codes.to_numpy() >= 0)
+    if mask is not None:
+        seleccion &= mask
+    sumas = group_sums([idx_año, tipos.codes.to_numpy()], [len(años), n_tipos],
+                       [df[col].to_numpy() for col in MEDIDAS], seleccion)
+    totales = {col.lower(): fila.reshape(len(años), n_tipos) for col, fila in zip(MEDIDAS, sumas)}
+    
+    # Escenarios: Real y Presupuesto del año actual, Real de cada año de referencia
+    real, presupuesto = tipos.categories.get_indexer(['Real', 'Presupuesto'])
+    filas = [(0, real, 'Real', año_actual), (0, presupuesto, 'Presupuesto', año_actual)]
+    filas += [(i, real, 'Real', int(año)) for i, año in enumerate(años[1:], start=1)]
+    idx_fila = np.array([f[0] for f in filas])
+    idx_tipo = np.array([f[1] for f in filas])
+    valido = idx_tipo >= 0
+    comparacion = pd.DataFrame({
+        'Tipo': [f[2] for f in filas],
+        'Año': [f[3] for f in filas],
+    }, index=[f"{f[2]} {f[3]}" for f in filas])
+    for key, matriz in totales.items():
+        comparacion[key] = np.where(valido, matriz[idx_fila, np.maximum(idx_tipo, 0)], 0.0)
+    
+    # Precio promedio como porcentaje (Ingresos/Recaudación) y factura promedio (Recaudacion/Transacciones)
+    comparacion['precio_prom'] = _ratio(comparacion['ingresos'], comparacion['recaudacion'], 100)
+    comparacion['factura_prom'] = _ratio(comparacion['recaudacion'], comparacion['trx'])
     
-    # Precio promedio como porcentaje (Ingresos/Recaudación)
-    metrics['precio_prom_2025'] = (metrics['real_2025']['ingresos'] / metrics['real_2025']['recaudacion'] * 100) if metrics['real_2025']['recaudacion'] > 0 else 0
-    metrics['precio_prom_2024'] = (metrics['real_2024']['ingresos'] / metrics['real_2024']['recaudacion'] * 100) if metrics['real_2024']['recaudacion'] > 0 else 0
-    metrics['precio_prom_presup_2025'] = (metrics['presupuesto_2025']['ingresos'] / metrics['presupuesto_2025']['recaudacion'] * 100) if metrics['presupuesto_2025']['recaudacion'] > 0 else 0
+    # Variaciones del Real actual contra cada escenario
+    actual = comparacion.iloc[0]
+    for key in ['trx', 'ingresos', 'recaudacion']:
+        comparacion[f'var_{key}'] = _ratio(actual[key] - comparacion[key], comparacion[key], 100)
+    comparacion['dif_precio'] = actual['precio_prom'] - comparacion['precio_prom']
+    comparacion['dif_factura'] = actual['factura_prom'] - comparacion['factura_prom']
+    return comparacion
+
+@instrumented('calculate_metrics')
+def calculate_metrics(df, ultimo_mes_datos_reales, mask=None, años_referencia=None):
+    """Calcular métricas principales a partir del cubo y la máscara de filtros"""
+    comparacion = compare_years(df, ultimo_mes_datos_reales, años_referencia, mask)
+    real = comparacion.iloc[0]
+    presupuesto = comparacion.iloc[1]
+    # El año anterior de los KPIs es el año de referencia más reciente
+    anterior = comparacion.iloc[2] if len(comparacion) > 2 else None
+    
+    def totales(fila):
+        return {key: (fila[key] if fila is not None else 0) for key in ['trx', 'ingresos', 'recaudacion']}
     
-    # Factura promedio (Recaudacion/Transacciones)
-    metrics['factura_prom_2025'] = metrics['real_2025']['recaudacion'] / metrics['real_2025']['trx'] if metrics['real_2025']['trx'] > 0 else 0
-    metrics['factura_prom_2024'] = metrics['real_2024']['recaudacion'] / metrics['real_2024']['trx'] if metrics['real_2024']['trx'] > 0 else 0
-    metrics['factura_prom_presup_2025'] = metrics['presupuesto_2025']['recaudacion'] / metrics['presupuesto_2025']['trx'] if metrics['presupuesto_2025']['trx'] > 0 else 0
+    def valor(fila, key):
+        return fila[key] if fila is not None else 0
     
+    metrics = {
+        'año_actual': int(real['Año']),
+        'año_anterior': int(anterior['Año']) if anterior is not None else None,
+        'comparacion': comparacion,
+        'real': totales(real),
+        'presupuesto': totales(presupuesto),
+        'anterior': totales(anterior),
+        'var_presupuesto': {key: presupuesto[f'var_{key}'] for key in ['trx', 'ingresos', 'recaudacion']},
+        'var_año_anterior': {key: valor(anterior, f'var_{key}') for key in ['trx', 'ingresos', 'recaudacion']},
+        'precio_prom': real['precio_prom'],
+        'precio_prom_presup': presupuesto['precio_prom'],
+        'precio_prom_anterior': valor(anterior, 'precio_prom'),
+        'factura_prom': real['factura_prom'],
+        'factura_prom_presup': presupuesto['factura_prom'],
+        'factura_prom_anterior': valor(anterior, 'factura_prom'),
+    }
     return metrics
 
+def build_kpis(metrics, ultimo_mes_datos_reales):
+    """Indicadores clave como (etiqueta, valor, variación) ya formateados.
+
+    Sin años de referencia las variaciones interanuales son None: comparar
+    contra 0 no tiene sentido.
+    """
+    año_actual = metrics['año_actual']
+    año_anterior = metrics['año_anterior']
+    precio_diff = metrics['precio_prom'] - metrics['precio_prom_anterior']
+    return [
+        (f"💳 Transacciones {año_actual} (hasta {ultimo_mes_datos_reales})",
+         format_number(metrics['real']['trx']),
+         f"{format_percentage(metrics['var_presupuesto']['trx'])} vs Presup."),
+        (f"💰 Ingresos {año_actual} (hasta {ultimo_mes_datos_reales})",
+         format_currency(metrics['real']['ingresos']),
+         f"{format_percentage(metrics['var_presupuesto']['ingresos'])} vs Presup."),
+        (f"🏦 Recaudación {año_actual} (hasta {ultimo_mes_datos_reales})",
+         format_currency(metrics['real']['recaudacion']),
+         f"{format_percentage(metrics['var_año_anterior']['recaudacion'])} vs {año_anterior}"
+         if año_anterior is not None else None),
+        ("💵 Precio Promedio (%)",
+         format_percentage(metrics['precio_prom']),
+         f"{precio_diff:.1f}pp vs {año_anterior}" if año_anterior is not None else None),
+    ]
+
+def build_summary_table(metrics):
+    """Armar la tabla resumen comparativa a partir del resultado del motor de comparación"""
+    comparacion = metrics['comparacion']
+    summary_data = {'Métrica': ['Transacciones', 'Ingresos', 'Recaudación', 'Precio Promedio (%)', 'Factura Promedio']}
+    for escenario, fila in comparacion.iterrows():
+        summary_data[escenario] = [
+            format_number(fila['trx']),
+            format_currency(fila['ingresos']),
+            format_currency(fila['recaudacion']),
+            format_percentage(fila['precio_prom']),
+            format_currency(fila['factura_prom'])
+        ]
+    for _, fila in comparacion.iloc[1:].iterrows():
+        etiqueta = 'Var. vs Presupuesto' if fila['Tipo'] == 'Presupuesto' else f"Var. vs {fila['Año']}"
+        summary_data[etiqueta] = [
+            format_percentage(fila['var_trx']),
+            format_percentage(fila['var_ingresos']),
+            format_percentage(fila['var_recaudacion']),
+            f"{fila['dif_precio']:.1f}pp",
+            format_currency(fila['dif_factura'])
+        ]
+    return pd.DataFrame(summary_data)
+
+def load_alert_rules(ruta=ALERT_RULES_PATH):
+    """Leer y validar las reglas de alertas de un archivo YAML"""
+    import yaml
+    with open(ruta, encoding='utf-8') as f:
+        try:
+            contenido = yaml.safe_load(f) or {}
+        except yaml.YAMLError as e:
+            raise ValueError(f"YAML inválido: {e}") from e
+    reglas = contenido.get('reglas') or []
+    for regla in reglas:
+        nombre = regla.get('nombre', '?')
+        faltantes = [k for k in ('nombre', 'metrica', 'condicion', 'umbral') if k not in regla]
+        if faltantes:
+            raise ValueError(f"Regla '{nombre}': faltan {', '.join(faltantes)}")
+        if regla['metrica'] not in METRICAS_ALERTA:
+            raise ValueError(f"Regla '{nombre}': métrica desconocida '{regla['metrica']}'")
+        if regla['condicion'] not in OPERADORES_ALERTA:
+            raise ValueError(f"Regla '{nombre}': condición desconocida '{regla['condicion']}'")
+        if regla.setdefault('nivel', 'warning') not in NIVELES_ALERTA:
+            raise ValueError(f"Regla '{nombre}': nivel desconocido '{regla['nivel']}'")
+        # La plantilla se prueba con valores de ejemplo, con y sin año de referencia
+        for año_anterior in (2024, None):
+            try:
+                _alert_message(regla, 0.0, 'Total', año_anterior, '2025-01')
+            except (KeyError, IndexError, AttributeError, TypeError, ValueError) as e:
+                raise ValueError(f"Regla '{nombre}': mensaje inválido ({type(e).__name__}: {e})") from e
+    return reglas
+
+def _alert_message(regla, valor, segmento, año_anterior, ultimo_mes):
+    """Texto de una alerta a partir de la plantilla 'mensaje' de la regla"""
+    return str(regla.get('mensaje', '{segmento}: {valor:.1f}')).format(
+        valor=valor, valor_abs=abs(valor), umbral=regla['umbral'], segmento=segmento,
+        año_anterior=año_anterior if año_anterior is not None else '-',
+        ultimo_mes=ultimo_mes, mes=ultimo_mes[-2:])
+
+def _alert_metrics(totales):
+    """Métricas de alerta de cada segmento a partir de totales [medida, escenario, ...].
+
+    Los escenarios son Real actual, Presupuesto actual y Real del año de
+    referencia. Las comparaciones contra un escenario sin datos quedan en NaN
+    para que ninguna regla se dispare por falta de datos.
+    """
+    trx, ingresos, recaudacion = totales
+    metricas = {}
+    for nombre, medida in zip(['trx', 'ingresos', 'recaudacion'], totales):
+        metricas[f'var_presupuesto_{nombre}'] = np.where(
+            medida[1] > 0, _ratio(medida[0] - medida[1], medida[1], 100), np.nan)
+        metricas[f'var_año_anterior_{nombre}'] = np.where(
+            medida[2] > 0, _ratio(medida[0] - medida[2], medida[2], 100), np.nan)
+    precio = _ratio(ingresos, recaudacion, 100)
+    factura = _ratio(recaudacion, trx)
+    metricas['precio_prom'] = precio[0]
+    metricas['dif_precio'] = np.where(recaudacion[2] > 0, precio[0] - precio[2], np.nan)
+    metricas['dif_precio_presupuesto'] = np.where(recaudacion[1] > 0, precio[0] - precio[1], np.nan)
+    metricas['factura_prom'] = factura[0]
+    metricas['dif_factura'] = np.where(trx[2] > 0, factura[0] - factura[2], np.nan)
+    metricas['dif_factura_presupuesto'] = np.where(trx[1] > 0, factura[0] - factura[1], np.nan)
+    return metricas
+
+@instrumented('evaluate_alert_rules')
+def evaluate_alert_rules(df, ultimo_mes_datos_reales, reglas, mask=None, años_referencia=None):
+    """Evaluar las reglas de alertas sobre el total y cada segmento de operación, canal y mes.
+
+    Una sola pasada de group_sums arma los totales por escenario, operación,
+    canal y mes (hasta el último mes); cada combinación de esas dimensiones
+    sale de sumar ejes del mismo array, y las reglas se evalúan como
+    comparaciones vectorizadas sobre todos los segmentos a la vez. Devuelve
+    las alertas ordenadas por nivel y por impacto: cuánto pasa la métrica el
+    umbral, ponderado por la participación del segmento en los ingresos.
+    """
+    ultimo_periodo = periodo_key(ultimo_mes_datos_reales)
+    año_actual, meses = ultimo_periodo // 100, ultimo_periodo % 100
+    if años_referencia is None:
+        años_referencia = default_reference_years(ultimo_mes_datos_reales)
+    # Como en los KPIs, el año anterior es el año de referencia más reciente
+    año_anterior = max(años_referencia) if años_referencia else None
+    
+    año = df['Año'].to_numpy()
+    tipos = df['Tipo'] if isinstance(df['Tipo'].dtype, pd.CategoricalDtype) else df['Tipo'].astype('category')
+    codigos_tipo = tipos.cat.codes.to_numpy()
+    real, presupuesto = tipos.cat.categories.get_indexer(['Real', 'Presupuesto'])
+    es_real = (codigos_tipo == real) & (real >= 0)
+    es_presupuesto = (codigos_tipo == presupuesto) & (presupuesto >= 0)
+    escenario = np.select([(año == año_actual) & es_real, (año == año_actual) & es_presupuesto,
+                           (año == año_anterior) & es_real], [0, 1, 2], -1)
+    mes = df['Mes'].to_numpy().astype(np.int64)
+    seleccion = mes <= meses
+    if mask is not None:
+        seleccion &= mask
+    dimensiones = [df[col] if isinstance(df[col].dtype, pd.CategoricalDtype) else df[col].astype('category')
+                   for col in ('Tipo_Operacion', 'Tipo_Canal')]
+    etiquetas = [list(dim.cat.categories) for dim in dimensiones] + [[f"{m:02d}" for m in range(1, meses + 1)]]
+    codigos = [escenario] + [dim.cat.codes.to_numpy() for dim in dimensiones] + [np.where(seleccion, mes - 1, -1)]
+    tamaños = [3] + [len(e) for e in etiquetas]
+    cubo = group_sums(codigos, tamaños, [df[col].to_numpy() for col in MEDIDAS], seleccion)
+    cubo = cubo.reshape([len(MEDIDAS)] + tamaños)
+    total_ingresos = cubo[1, 0].sum()
+    
+    filas = []
+    nombres = ['Operación', 'Canal', 'Mes']
+    for conservar in itertools.product([False, True], repeat=3):
+        # Totales del segmento: se suman los ejes de las dimensiones que no se conservan
+        totales = cubo.sum(axis=tuple(2 + i for i, c in enumerate(conservar) if not c))
+        metricas = _alert_metrics(totales)
+        participacion = _ratio(totales[1, 0], total_ingresos)
+        con_datos = (totales > 0).any(axis=(0, 1))
+        ejes = [i for i, c in enumerate(conservar) if c]
+        for orden, regla in enumerate(reglas):
+            valores = metricas[regla['metrica']]
+            with np.errstate(invalid='ignore'):
+                dispara = (OPERADORES_ALERTA[regla['condicion']](valores, regla['umbral']) & con_datos &
+                           (participacion >= regla.get('min_participacion', 0)))
+            for plano in np.flatnonzero(dispara):
+                posicion = np.unravel_index(plano, dispara.shape) if dispara.ndim else ()
+                segmento = {nombres[eje]: etiquetas[eje][p] for eje, p in zip(ejes, posicion)}
+                valor = float(valores[posicion])
+                filas.append({
+                    'orden': orden,
+                    'nivel': regla['nivel'],
+                    'regla': regla['nombre'],
+                    'segmento': ' · '.join(f"{k}: {v}" for k, v in segmento.items()) or 'Total',
+                    **{nombre: segmento.get(nombre, 'Todos') for nombre in nombres},
+                    'metrica': regla['metrica'],
+                    'valor': valor,
+                    'umbral': regla['umbral'],
+                    'participacion': float(participacion[posicion]),
+                    'impacto': abs(valor - regla['umbral']) * float(participacion[posicion]),
+                    'mensaje': _alert_message(regla, valor, ' · '.join(segmento.values()) or 'Total',
+                                              año_anterior, ultimo_mes_datos_reales),
+                })
+    alertas = pd.DataFrame(filas, columns=['orden', 'nivel', 'regla', 'segmento', *nombres, 'metrica', 'valor',
+                                           'umbral', 'participacion', 'impacto', 'mensaje'])
+    alertas['rango_nivel'] = alertas['nivel'].map({n: i for i, n in enumerate(NIVELES_ALERTA)})
+    return alertas.sort_values(['rango_nivel', 'impacto'], ascending=[True, False], ignore_index=True).drop(
+        columns='rango_nivel')
+
 def format_number(num):
     """Formatear números"""
     return f"{num:,.0f}".replace(',', '.')
@@ -203,30 +1756,115 @@ def format_percentage(num):
     """Formatear porcentaje"""
     return f"{num:.1f}%"
 
-def create_monthly_comparison_chart(df_filtered, ultimo_mes_datos_reales):
-    """Crear gráfico de comparación mensual"""
-    # Filtrar datos: 2025 hasta ultimo_mes_datos_reales, 2024 completo
-    df_filtered_2025 = df_filtered[
-        (df_filtered['AñoMes'].str.startswith('2025')) & 
-        (df_filtered['AñoMes'] <= ultimo_mes_datos_reales)
-    ]
-    df_filtered_2024 = df_filtered[
-        (df_filtered['AñoMes'].str.startswith('2024')) & 
-        (df_filtered['Tipo'] == 'Real')
-    ]
-    df_filtered = pd.concat([df_filtered_2025, df_filtered_2024])
+def lttb_indices(y, n_out):
+    """Índices de la serie reducida a n_out puntos con Largest-Triangle-Three-Buckets"""
+    n = len(y)
+    if n <= n_out or n_out < 3:
+        return np.arange(n)
+    y = np.nan_to_num(np.asarray(y, dtype=float))
+    x = np.arange(n, dtype=float)
+    # Bordes de los n_out - 2 buckets interiores; el primer y el último punto se conservan
+    bordes = np.linspace(1, n - 1, n_out - 1).astype(int)
+    indices = np.empty(n_out, dtype=np.int64)
+    indices[0], indices[-1] = 0, n - 1
+    elegido = 0
+    for i in range(n_out - 2):
+        inicio, fin = bordes[i], bordes[i + 1]
+        siguiente_fin = bordes[i + 2] if i + 2 < len(bordes) else n
+        prom_x = x[fin:siguiente_fin].mean()
+        prom_y = y[fin:siguiente_fin].mean()
+        # Área del triángulo entre el punto elegido, cada candidato y el promedio del bucket siguiente
+        area = np.abs((x[elegido] - prom_x) * (y[inicio:fin] - y[elegido]) -
+                      (x[elegido] - x[inicio:fin]) * (prom_y - y[elegido]))
+        elegido = inicio + int(np.argmax(area))
+        indices[i + 1] = elegido
+    return indices
+
+def minmax_indices(y, n_out):
+    """Índices del mínimo y el máximo de cada bucket, para reducir barras sin perder picos"""
+    n = len(y)
+    if n <= n_out:
+        return np.arange(n)
+    y = np.nan_to_num(np.asarray(y, dtype=float))
+    bordes = np.linspace(0, n, max(n_out // 2, 1) + 1).astype(int)
+    indices = []
+    for inicio, fin in zip(bordes[:-1], bordes[1:]):
+        tramo = y[inicio:fin]
+        indices.extend(sorted({inicio + int(np.argmin(tramo)), inicio + int(np.argmax(tramo))}))
+    return np.array(indices, dtype=np.int64)
+
+def _compact_values(y, n):
+    # Con muchos puntos se envían float32 (plotly los serializa como base64 tipado), pero
+    # solo si representan los valores exactamente: los montos grandes pierden pesos en float32
+    y = np.asarray(y, dtype=np.float64)
+    if n > MAX_PUNTOS_SVG and np.array_equal(y.astype(np.float32), y, equal_nan=True):
+        return y.astype(np.float32)
+    return y
+
+def line_trace(x, y, **kwargs):
+    """Traza de líneas: WebGL y reducción LTTB en el servidor cuando hay muchos puntos"""
+    import plotly.graph_objects as go
+    x, y = np.asarray(x), np.asarray(y, dtype=float)
+    n = len(y)
+    if n > MAX_PUNTOS_TRAZA:
+        indices = lttb_indices(y, MAX_PUNTOS_TRAZA)
+        x, y = x[indices], y[indices]
+    trace_cls = go.Scattergl if n > MAX_PUNTOS_SVG else go.Scatter
+    return trace_cls(x=x, y=_compact_values(y, n), **kwargs)
+
+def bar_trace(x, y, **kwargs):
+    """Traza de barras reducida por mínimo/máximo de bucket cuando hay muchos puntos"""
+    import plotly.graph_objects as go
+    x, y = np.asarray(x), np.asarray(y, dtype=float)
+    n = len(y)
+    if n > MAX_PUNTOS_TRAZA:
+        indices = minmax_indices(y, MAX_PUNTOS_TRAZA)
+        x, y = x[indices], y[indices]
+    return go.Bar(x=x, y=_compact_values(y, n), **kwargs)
+
+def top_categories(summary, nombre, valor, max_categorias=MAX_CATEGORIAS):
+    """Conservar las categorías de mayor valor y agrupar el resto en 'Otros'"""
+    if len(summary) <= max_categorias:
+        return summary
+    summary = summary.sort_values(valor, ascending=False)
+    principales = summary.iloc[:max_categorias - 1].copy()
+    principales[nombre] = principales[nombre].astype(str)
+    otros = pd.DataFrame({nombre: ['Otros'], valor: [summary.iloc[max_categorias - 1:][valor].sum()]})
+    return pd.concat([principales[[nombre, valor]], otros], ignore_index=True)
+
+def compute_monthly_data(df, ultimo_mes_datos_reales, mask=None, años_referencia=None):
+    """Agregar por mes y tipo los datos del gráfico comparativo"""
+    ultimo_periodo = periodo_key(ultimo_mes_datos_reales)
+    if años_referencia is None:
+        años_referencia = default_reference_years(ultimo_mes_datos_reales)
+    año = df['Año'].to_numpy()
+    # Filtrar datos en una sola máscara: año actual hasta ultimo_mes_datos_reales, años de referencia completos
+    seleccion = (((año == ultimo_periodo // 100) & (df['Periodo'].to_numpy() <= ultimo_periodo)) |
+                 (np.isin(año, list(años_referencia)) & (df['Tipo'] == 'Real').to_numpy()))
+    if mask is not None:
+        seleccion &= mask
     
-    # Agrupar datos por mes y tipo
-    monthly_data = df_filtered.groupby(['AñoMes', 'Tipo']).agg({
-        'Trx': 'sum',
-        'Ingresos': 'sum',
-        'Recaudacion': 'sum'
-    }).reset_index()
+    # Agrupar datos por mes y tipo; Periodo y Año se derivan del mes
+    monthly_data = grouped_sum(df, ['AñoMes', 'Tipo'], seleccion=seleccion)
+    periodos_cat = np.array([periodo_key(v) for v in monthly_data['AñoMes'].cat.categories], dtype=np.int32)
+    periodos = periodos_cat[monthly_data['AñoMes'].cat.codes.to_numpy()]
+    monthly_data.insert(0, 'Periodo', periodos)
+    monthly_data.insert(2, 'Año', (periodos // 100).astype(np.int16))
     
     # Calcular métricas adicionales
     monthly_data['Precio_Porcentual'] = (monthly_data['Ingresos'] / monthly_data['Recaudacion'] * 100)
     monthly_data['Factura_Promedio'] = monthly_data['Recaudacion'] / monthly_data['Trx']
     monthly_data['Precio_Transaccion'] = monthly_data['Ingresos'] / monthly_data['Trx']
+    return monthly_data
+
+@instrumented('create_monthly_comparison_chart')
+def create_monthly_comparison_chart(df, ultimo_mes_datos_reales, mask=None, años_referencia=None):
+    """Crear gráfico de comparación mensual"""
+    from plotly.subplots import make_subplots
+    if años_referencia is None:
+        años_referencia = default_reference_years(ultimo_mes_datos_reales)
+    año_actual = periodo_key(ultimo_mes_datos_reales) // 100
+    monthly_data = compute_monthly_data(df, ultimo_mes_datos_reales, mask, años_referencia)
     
     # Crear gráfico con subplots 2x3
     fig = make_subplots(
@@ -241,297 +1879,453 @@ def create_monthly_comparison_chart(df_filtered, ultimo_mes_datos_reales):
     presup_data = monthly_data[monthly_data['Tipo'] == 'Presupuesto']
     
     fig.add_trace(
-        go.Scatter(x=real_data['AñoMes'], y=real_data['Trx'], mode='lines+markers', name='Real - Trx', 
-                  line=dict(color='#3b82f6', width=3), marker=dict(size=8)),
+        line_trace(x=real_data['AñoMes'], y=real_data['Trx'], mode='lines+markers', name='Real - Trx', 
+                   line=dict(color='#3b82f6', width=3), marker=dict(size=8)),
         row=1, col=1
     )
     fig.add_trace(
-        go.Scatter(x=presup_data['AñoMes'], y=presup_data['Trx'], mode='lines+markers', name='Presupuesto - Trx', 
-                  line=dict(color='#10b981', width=3), marker=dict(size=8)),
+        line_trace(x=presup_data['AñoMes'], y=presup_data['Trx'], mode='lines+markers', name='Presupuesto - Trx', 
+                   line=dict(color='#10b981', width=3), marker=dict(size=8)),
         row=1, col=1
     )
     
     # Gráfico de Ingresos
     fig.add_trace(
-        go.Scatter(x=real_data['AñoMes'], y=real_data['Ingresos'], mode='lines+markers', name='Real - Ingresos', 
-                  line=dict(color='#ef4444', width=3)),
+        line_trace(x=real_data['AñoMes'], y=real_data['Ingresos'], mode='lines+markers', name='Real - Ingresos', 
+                   line=dict(color='#ef4444', width=3)),
         row=1, col=2
     )
     fig.add_trace(
-        go.Scatter(x=presup_data['AñoMes'], y=presup_data['Ingresos'], mode='lines+markers', name='Presupuesto - Ingresos', 
-                  line=dict(color='#f59e0b', width=3)),
+        line_trace(x=presup_data['AñoMes'], y=presup_data['Ingresos'], mode='lines+markers', name='Presupuesto - Ingresos', 
+                   line=dict(color='#f59e0b', width=3)),
         row=1, col=2
     )
     
     # Gráfico de Recaudación
     fig.add_trace(
-        go.Bar(x=real_data['AñoMes'], y=real_data['Recaudacion'], name='Real - Recaudación', marker_color='#8b5cf6'),
+        bar_trace(x=real_data['AñoMes'], y=real_data['Recaudacion'], name='Real - Recaudación', marker_color='#8b5cf6'),
         row=1, col=3
     )
     fig.add_trace(
-        go.Bar(x=presup_data['AñoMes'], y=presup_data['Recaudacion'], name='Presupuesto - Recaudación', marker_color='#06b6d4'),
+        bar_trace(x=presup_data['AñoMes'], y=presup_data['Recaudacion'], name='Presupuesto - Recaudación', marker_color='#06b6d4'),
         row=1, col=3
     )
     
     # Gráfico de Factura Promedio
     fig.add_trace(
-        go.Scatter(x=real_data['AñoMes'], y=real_data['Factura_Promedio'], mode='lines+markers', name='Real - Factura Prom', 
-                  line=dict(color='#dc2626', width=3)),
+        line_trace(x=real_data['AñoMes'], y=real_data['Factura_Promedio'], mode='lines+markers', name='Real - Factura Prom', 
+                   line=dict(color='#dc2626', width=3)),
         row=2, col=1
     )
     fig.add_trace(
-        go.Scatter(x=presup_data['AñoMes'], y=presup_data['Factura_Promedio'], mode='lines+markers', name='Presupuesto - Factura Prom', 
-                  line=dict(color='#059669', width=3)),
+        line_trace(x=presup_data['AñoMes'], y=presup_data['Factura_Promedio'], mode='lines+markers', name='Presupuesto - Factura Prom', 
+                   line=dict(color='#059669', width=3)),
         row=2, col=1
     )
     
-    # Precio porcentual YoY (2025 y 2024 completo)
-    real_2025 = real_data[real_data['AñoMes'].str.startswith('2025')]
-    real_2024 = real_data[real_data['AñoMes'].str.startswith('2024')]
+    # Precio porcentual YoY (año actual y años de referencia completos)
+    real_actual = real_data[real_data['Año'] == año_actual]
     
     fig.add_trace(
-        go.Scatter(x=real_2025['AñoMes'], y=real_2025['Precio_Porcentual'], mode='lines+markers', name='2025 - Precio %', 
-                  line=dict(color='#dc2626', width=4)),
-        row=2, col=2
-    )
-    fig.add_trace(
-        go.Scatter(x=real_2024['AñoMes'], y=real_2024['Precio_Porcentual'], mode='lines+markers', name='2024 - Precio %', 
-                  line=dict(color='#7c3aed', width=4)),
+        line_trace(x=real_actual['AñoMes'], y=real_actual['Precio_Porcentual'], mode='lines+markers', name=f'{año_actual} - Precio %', 
+                   line=dict(color='#dc2626', width=4)),
         row=2, col=2
     )
+    for i, año in enumerate(sorted(años_referencia, reverse=True)):
+        real_ref = real_data[real_data['Año'] == año]
+        fig.add_trace(
+            line_trace(x=real_ref['AñoMes'], y=real_ref['Precio_Porcentual'], mode='lines+markers', name=f'{año} - Precio %', 
+                       line=dict(color=COLORES_REFERENCIA[i % len(COLORES_REFERENCIA)], width=4)),
+            row=2, col=2
+        )
     
     # Precio por Transacción
     fig.add_trace(
-        go.Scatter(x=real_data['AñoMes'], y=real_data['Precio_Transaccion'], mode='lines+markers', name='Real - Precio/Transacción', 
-                  line=dict(color='#be123c', width=3)),
+        line_trace(x=real_data['AñoMes'], y=real_data['Precio_Transaccion'], mode='lines+markers', name='Real - Precio/Transacción', 
+                   line=dict(color='#be123c', width=3)),
         row=2, col=3
     )
     fig.add_trace(
-        go.Scatter(x=presup_data['AñoMes'], y=presup_data['Precio_Transaccion'], mode='lines+markers', name='Presupuesto - Precio/Transacción', 
-                  line=dict(color='#0891b2', width=3)),
+        line_trace(x=presup_data['AñoMes'], y=presup_data['Precio_Transaccion'], mode='lines+markers', name='Presupuesto - Precio/Transacción', 
+                   line=dict(color='#0891b2', width=3)),
         row=2, col=3
     )
     
     fig.update_layout(height=900, showlegend=True, title_text="Análisis Comparativo Financiero Completo")
     return fig
 
-def create_distribution_chart(df_filtered, ultimo_mes_datos_reales):
+def real_ytd_mask(df, ultimo_mes_datos_reales, mask=None):
+    """Máscara del Real del año actual hasta el último mes de datos reales"""
+    seleccion = ((df['Año'].to_numpy() == periodo_key(ultimo_mes_datos_reales) // 100) & 
+                 (df['Tipo'] == 'Real').to_numpy() & 
+                 (df['Periodo'].to_numpy() <= periodo_key(ultimo_mes_datos_reales)))
+    if mask is not None:
+        seleccion &= mask
+    return seleccion
+
+@instrumented('create_distribution_chart')
+def create_distribution_chart(df, ultimo_mes_datos_reales, mask=None):
     """Crear gráfico de distribución por canal"""
-    # Datos para 2025 Real, hasta el último mes de datos reales
-    canal_data = df_filtered[(df_filtered['AñoMes'].str.startswith('2025')) & 
-                            (df_filtered['Tipo'] == 'Real') & 
-                            (df_filtered['AñoMes'] <= ultimo_mes_datos_reales)]
-    canal_summary = canal_data.groupby('Tipo_Canal').agg({
-        'Trx': 'sum',
-        'Ingresos': 'sum'
-    }).reset_index()
+    import plotly.express as px
+    # Datos del Real del año actual, hasta el último mes de datos reales
+    canal_summary = grouped_sum(df, ['Tipo_Canal'], ['Trx', 'Ingresos'],
+                                real_ytd_mask(df, ultimo_mes_datos_reales, mask))
+    canal_summary = top_categories(canal_summary, 'Tipo_Canal', 'Trx')
     
     fig = px.pie(canal_summary, values='Trx', names='Tipo_Canal', 
-                 title=f'Distribución de Transacciones por Canal (2025 hasta {ultimo_mes_datos_reales})',
+                 title=f'Distribución de Transacciones por Canal ({ultimo_mes_datos_reales[:4]} hasta {ultimo_mes_datos_reales})',
                  color_discrete_sequence=px.colors.qualitative.Set3)
     return fig
 
+def precompute_tasks(dataset_hash, cube, indice, meses_actuales):
+    """Tareas de precálculo de las vistas más probables, de la más a la menos probable.
+
+    Se precalculan las selecciones de a lo sumo un valor de operación, canal
+    y mes (las combinaciones con varios valores son demasiadas). Primero el
+    último mes más reciente (el que se abre por defecto) y, dentro de cada
+    último mes, las vistas con menos filtros. Cada vista usa los años de
+    referencia por defecto. Las métricas de todas las vistas van antes que
+    las figuras porque son mucho más baratas. Devuelve pares (clave, cálculo).
+    """
+    opciones = filter_options(cube)
+    combinaciones = [{'Tipo_Operacion': op, 'Tipo_Canal': canal, 'Mes': mes}
+                     for op in [[]] + [[v] for v in opciones['Tipo_Operacion']]
+                     for canal in [[]] + [[v] for v in opciones['Tipo_Canal']]
+                     for mes in [[]] + [[v] for v in opciones['Mes']]]
+    combinaciones.sort(key=lambda filtros: sum(bool(valores) for valores in filtros.values()))
+    vistas = []
+    for ultimo in reversed(meses_actuales):
+        referencias = reference_year_options(cube, ultimo)[1]
+        vistas += [(view_key(dataset_hash, filtros, ultimo, referencias), filtros, ultimo, referencias)
+                   for filtros in combinaciones]
+
+    def metricas(filtros, ultimo, referencias):
+        return calculate_metrics(cube, ultimo, indice.mask(filtros), referencias)
+
+    def figura(parte, filtros, ultimo, referencias):
+        mask = indice.mask(filtros)
+        if parte == 'mensual':
+            fig = create_monthly_comparison_chart(cube, ultimo, mask, referencias)
+        elif parte == 'distribucion':
+            fig = create_distribution_chart(cube, ultimo, mask)
+        else:
+            fig = create_operation_chart(cube, ultimo, mask)
+        return fig.to_json()
+
+    tareas = [(vista + ('metrics',), lambda f=filtros, u=ultimo, r=referencias: metricas(f, u, r))
+              for vista, filtros, ultimo, referencias in vistas]
+    tareas += [(vista + (parte,), lambda p=parte, f=filtros, u=ultimo, r=referencias: figura(p, f, u, r))
+               for vista, filtros, ultimo, referencias in vistas
+               for parte in ('mensual', 'distribucion', 'operacion')]
+    return tareas[:PRECOMPUTE_MAX_ENTRIES]
+
+class ViewPrecomputer:
+    """Precálculo en segundo plano de las vistas de cada dataset.
+
+    Hay a lo sumo un trabajo por dataset, compartido por todas las sesiones
+    que lo usan; corre en un hilo daemon y fija los resultados en la caché de
+    vistas (MemoCache.warm), así que los clics sobre vistas ya precalculadas
+    son solo lecturas. Si un trabajo terminado sin error ya no cubre todas
+    sus claves (la caché expulsó su dataset) se relanza, a lo sumo una vez
+    cada PRECOMPUTE_RETRY_SECONDS, y recalcula solo las faltantes; un
+    trabajo que falló no se relanza. Los trabajos de datasets que
+    salieron del registro se cancelan y sus entradas se liberan.
+    """
+
+    def __init__(self, memo):
+        self.memo = memo
+        self._lock = threading.Lock()
+        self._jobs = {}
+
+    def start(self, dataset_hash, build_tasks):
+        """Lanzar el precálculo del dataset si no existe o perdió entradas y devolver su estado"""
+        with self._lock:
+            job = self._jobs.get(dataset_hash)
+            if (job is not None and job['terminado'] and not job['error'] and
+                    time.time() - job['fin'] >= PRECOMPUTE_RETRY_SECONDS and
+                    self.coverage(job) < job['total']):
+                job = None
+            if job is None:
+                tareas = build_tasks()
+                job = {'total': len(tareas), 'hechas': 0, 'terminado': False, 'error': None, 'fin': None,
+                       'claves': [key for key, _ in tareas], 'cancelado': threading.Event()}
+                self._jobs[dataset_hash] = job
+                threading.Thread(target=self._run, args=(job, tareas), daemon=True,
+                                 name=f'precalculo-{dataset_hash[:8]}').start()
+            return job
+
+    def cancel_missing(self, activos):
+        """Cancelar y olvidar los trabajos de datasets que ya no están registrados"""
+        with self._lock:
+            for dataset_hash in [h for h in self._jobs if h not in activos]:
+                self._jobs.pop(dataset_hash)['cancelado'].set()
+                self.memo.release(dataset_hash)
+
+    def coverage(self, job):
+        """Claves del trabajo que siguen en la caché"""
+        return self.memo.coverage(job['claves'])
+
+    def _run(self, job, tareas):
+        try:
+            for key, compute in tareas:
+                if job['cancelado'].is_set():
+                    return
+                self.memo.warm(key, compute)
+                job['hechas'] += 1
+                time.sleep(PRECOMPUTE_PAUSE_SECONDS)
+        except Exception as e:
+            job['error'] = str(e)
+        finally:
+            job['fin'] = time.time()
+            job['terminado'] = True
+
+@st.cache_resource
+def get_precomputer():
+    """Precálculo de vistas único para todo el proceso"""
+    return ViewPrecomputer(get_memo_cache())
+
+def render_precompute_status(precomputer, job):
+    """Mostrar en el sidebar el avance del precálculo y cuántas vistas siguen en la caché"""
+    if job['error']:
+        st.sidebar.caption(f"⚠️ Precálculo interrumpido: {job['error']}")
+    elif not job['terminado']:
+        st.sidebar.progress(job['hechas'] / max(job['total'], 1),
+                            text=f"🔥 Precalculando vistas: {job['hechas']}/{job['total']}")
+    else:
+        st.sidebar.caption(f"🔥 {precomputer.coverage(job)}/{job['total']} vistas precalculadas en caché")
+
+def setup_page():
+    """Inyectar el CSS de la página; la contraseña ya se validó en check_password"""
+    # CSS personalizado
+    st.markdown("""
+<style>
+    .main-header {
+        font-size: 2.5rem;
+        font-weight: bold;
+        color: #1f2937;
+        text-align: center;
+        margin-bottom: 2rem;
+    }
+    .metric-card {
+        background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
+        padding: 1rem;
+        border-radius: 10px;
+        color: white;
+        text-align: center;
+    }
+    .kpi-positive {
+        color: #10b981;
+        font-weight: bold;
+    }
+    .kpi-negative {
+        color: #ef4444;
+        font-weight: bold;
+    }
+    .sidebar .sidebar-content {
+        background: linear-gradient(180deg, #f8fafc 0%, #e2e8f0 100%);
+    }
+</style>
+    """, unsafe_allow_html=True)
+
+def create_operation_chart(df, ultimo_mes_datos_reales, mask=None):
+    """Crear gráfico de ingresos por tipo de operación"""
+    import plotly.express as px
+    op_summary = grouped_sum(df, ['Tipo_Operacion'], ['Ingresos'], real_ytd_mask(df, ultimo_mes_datos_reales, mask))
+    op_summary = top_categories(op_summary, 'Tipo_Operacion', 'Ingresos')
+    fig = px.bar(op_summary, x='Tipo_Operacion', y='Ingresos',
+                 title=f'Ingresos por Tipo de Operación ({ultimo_mes_datos_reales[:4]} hasta {ultimo_mes_datos_reales})',
+                 color='Ingresos', color_continuous_scale='viridis')
+    return fig
+
+def render_perf_panel(registros):
+    """Mostrar el panel de rendimiento del rerun y guardar el historial"""
+    historial = st.session_state.setdefault('perf_historial', [])
+    historial.extend(registros)
+    del historial[:-PERF_HISTORY_MAX]
+    if PERF_LOG_PATH:
+        with open(PERF_LOG_PATH, 'a', encoding='utf-8') as f:
+            f.write(export_perf_jsonl(registros))
+    
+    with st.sidebar.expander("⏱️ Performance"):
+        if registros:
+            perf_df = pd.DataFrame(registros)[['etapa', 'segundos', 'filas', 'memoria_mb']]
+            st.dataframe(perf_df, hide_index=True, use_container_width=True)
+            st.caption(f"Total medido: {perf_df['segundos'].sum() * 1000:.1f} ms")
+        st.download_button("📥 Exportar historial (JSONL)", export_perf_jsonl(historial),
+                           file_name="performance.jsonl", mime="application/jsonl")
+
 def main():
+    setup_page()
+    registros_perf = start_perf_recording()
+    
     # Título principal
     st.markdown('<h1 class="main-header">💰 Dashboard Financiero Interactivo</h1>', unsafe_allow_html=True)
     
     # Sidebar para filtros
     st.sidebar.header("🎛️ Filtros")
     
-    # Cargar datos
-    df, ultimo_mes_datos_reales, meses_2025 = load_data()
-    
     # Opción para cargar archivo
-    uploaded_file = st.sidebar.file_uploader("📁 Cargar archivo Excel", type=['xlsx', 'xls'])
+    uploaded_file = st.sidebar.file_uploader("📁 Cargar archivo Excel o CSV", type=['xlsx', 'xls', 'csv'])
+    streaming = st.sidebar.checkbox("🌊 Ingesta por streaming (archivos muy grandes)",
+                                    help="Lee el archivo por bloques y guarda solo los totales mensuales")
+    modo_carga = st.sidebar.radio("🔄 Modo de carga", ["Reemplazar dataset", "Agregar períodos"], horizontal=True,
+                                  help="Agregar períodos suma al dataset actual solo los meses nuevos del archivo")
     if uploaded_file is not None:
         try:
-            df = pd.read_excel(uploaded_file)
-            st.session_state.df = df
-            ultimo_mes_datos_reales = df[df['Tipo'] == 'Real']['AñoMes'].max()
-            meses_2025 = sorted(df[(df['AñoMes'].str.startswith('2025')) & (df['Tipo'] == 'Real')]['AñoMes'].unique())
+            # En los reruns el archivo ya está procesado: no se vuelve a leer ni a hashear
+            upload_id = (uploaded_file.file_id, streaming, modo_carga)
+            if st.session_state.get('upload_id') != upload_id:
+                barra = st.sidebar.progress(0.0, text="Procesando archivo...") if streaming else None
+                progress = (lambda avance: barra.progress(avance, text=f"Procesando archivo... {avance:.0%}")) if streaming else None
+                if modo_carga == "Agregar períodos":
+                    st.session_state.dataset_hash = append_uploaded_file(
+                        uploaded_file, st.session_state.get('dataset_hash', default_dataset_hash()), streaming, progress)
+                else:
+                    st.session_state.dataset_hash = load_uploaded_file(uploaded_file, streaming, progress)
+                st.session_state.upload_id = upload_id
+                if barra is not None:
+                    barra.empty()
             st.sidebar.success("¡Archivo cargado exitosamente!")
         except Exception as e:
             st.sidebar.error(f"Error al cargar archivo: {e}")
     
+    # Cargar datos
+    filas, cube, indice, ultimo_mes_datos_reales, meses_actuales, rechazos = load_data()
+    
     # Dropdown para seleccionar último mes
-    selected_ultimo_mes = st.sidebar.selectbox("📅 Último Mes para Comparaciones", meses_2025, index=len(meses_2025)-1)
+    selected_ultimo_mes = st.sidebar.selectbox("📅 Último Mes para Comparaciones", meses_actuales, index=len(meses_actuales)-1)
     ultimo_mes_datos_reales = selected_ultimo_mes
     
+    # Años contra los que se compara el acumulado del año actual
+    años_disponibles, años_por_defecto = reference_year_options(cube, ultimo_mes_datos_reales)
+    años_referencia = st.sidebar.multiselect("📆 Años de referencia", años_disponibles, default=años_por_defecto)
+    
     # Mostrar información del dataset
-    st.sidebar.info(f"📊 Total de registros: {len(df)}")
+    st.sidebar.info(f"📊 Total de registros: {filas}")
+    if rechazos and rechazos['filas']:
+        # Filas descartadas por la validación del esquema al ingerir el archivo
+        st.sidebar.warning(f"⚠️ Se descartaron {rechazos['filas']:,} filas con errores de datos")
+        with st.sidebar.expander("🔍 Filas rechazadas"):
+            st.dataframe(pd.DataFrame(list(rechazos['motivos'].items()), columns=['Motivo', 'Filas']),
+                         hide_index=True, use_container_width=True)
+            st.dataframe(pd.DataFrame(rechazos['ejemplos']).rename(columns=str.capitalize),
+                         hide_index=True, use_container_width=True)
+    if st.session_state.dataset_hash.startswith(DB_PREFIX):
+        st.sidebar.info(f"🗄️ Base {database_engine(DATA_DB_PATH)}: {Path(DATA_DB_PATH).name}")
     st.sidebar.info(f"📅 Último mes seleccionado: {ultimo_mes_datos_reales}")
     
-    # Filtros
-    operaciones = ['Todos'] + list(df['Tipo_Operacion'].unique())
-    canales = ['Todos'] + list(df['Tipo_Canal'].unique())
-    meses = ['Todos'] + sorted(list(df['AñoMes'].str[-2:].unique()))
+    # Filtros de selección múltiple sobre el cubo pre-agregado; sin selección equivale a todos
+    filtros = {}
+    for dimension, opciones in filter_options(cube).items():
+        filtros[dimension] = st.sidebar.multiselect(
+            FILTROS.get(dimension, f"🔎 {dimension}"), opciones, placeholder="Todos",
+            format_func=(lambda m: f"{m:02d}") if dimension == 'Mes' else str)
     
-    selected_operacion = st.sidebar.selectbox("🏪 Tipo de Operación", operaciones)
-    selected_canal = st.sidebar.selectbox("📱 Canal", canales)
-    selected_mes = st.sidebar.selectbox("📅 Mes", meses)
+    # Aplicar filtros: OR/AND de los bitmaps precalculados, sin recorrer las columnas
+    with perf_stage('filtros', len(cube)):
+        mask = indice.mask(filtros)
     
-    # Aplicar filtros
-    df_filtered = df.copy()
-    if selected_operacion != 'Todos':
-        df_filtered = df_filtered[df_filtered['Tipo_Operacion'] == selected_operacion]
-    if selected_canal != 'Todos':
-        df_filtered = df_filtered[df_filtered['Tipo_Canal'] == selected_canal]
-    if selected_mes != 'Todos':
-        df_filtered = df_filtered[df_filtered['AñoMes'].str.endswith(selected_mes)]
+    # Vista actual: las métricas y figuras se memoizan por dataset, filtros y último mes
+    memo = get_memo_cache()
+    dataset_hash = st.session_state.dataset_hash
+    vista = view_key(dataset_hash, filtros, ultimo_mes_datos_reales, años_referencia)
+    
+    # Las demás vistas del dataset se precalculan en segundo plano
+    if PRECOMPUTE_ENABLED:
+        precomputer = get_precomputer()
+        precomputer.cancel_missing(get_registry().stats())
+        render_precompute_status(precomputer, precomputer.start(
+            dataset_hash, lambda: precompute_tasks(dataset_hash, cube, indice, meses_actuales)))
     
     # Calcular métricas
-    metrics = calculate_metrics(df_filtered, ultimo_mes_datos_reales)
+    metrics = memo.get_or_compute(vista + ('metrics',),
+                                  lambda: calculate_metrics(cube, ultimo_mes_datos_reales, mask, años_referencia))
     
     # KPIs principales
     st.subheader("📈 Indicadores Clave de Desempeño")
     
-    col1, col2, col3, col4 = st.columns(4)
-    
-    with col1:
-        st.metric(
-            label=f"💳 Transacciones 2025 (hasta {ultimo_mes_datos_reales})",
-            value=format_number(metrics['real_2025']['trx']),
-            delta=f"{format_percentage(metrics['var_presupuesto']['trx'])} vs Presup."
-        )
-    
-    with col2:
-        st.metric(
-            label=f"💰 Ingresos 2025 (hasta {ultimo_mes_datos_reales})",
-            value=format_currency(metrics['real_2025']['ingresos']),
-            delta=f"{format_percentage(metrics['var_presupuesto']['ingresos'])} vs Presup."
-        )
-    
-    with col3:
-        st.metric(
-            label=f"🏦 Recaudación 2025 (hasta {ultimo_mes_datos_reales})",
-            value=format_currency(metrics['real_2025']['recaudacion']),
-            delta=f"{format_percentage(metrics['var_año_anterior']['recaudacion'])} vs 2024"
-        )
-    
-    with col4:
-        precio_diff = metrics['precio_prom_2025'] - metrics['precio_prom_2024']
-        st.metric(
-            label="💵 Precio Promedio (%)",
-            value=format_percentage(metrics['precio_prom_2025']),
-            delta=f"{precio_diff:.1f}pp vs 2024"
-        )
+    for columna, (label, value, delta) in zip(st.columns(4), build_kpis(metrics, ultimo_mes_datos_reales)):
+        with columna:
+            st.metric(label=label, value=value, delta=delta)
     
     # Gráficos principales
     st.subheader("📊 Análisis Visual")
     
-    # Tabs para diferentes análisis
-    tab1, tab2, tab3, tab4 = st.tabs(["📈 Tendencias", "🥧 Distribución", "📋 Tabla Resumen", "🚨 Alertas"])
+    # Selector de sección: a diferencia de st.tabs, solo se calcula y envía la sección visible
+    seccion = st.radio("Sección", SECCIONES, horizontal=True, key='seccion', label_visibility='collapsed')
     
-    with tab1:
-        fig_monthly = create_monthly_comparison_chart(df_filtered, ultimo_mes_datos_reales)
-        st.plotly_chart(fig_monthly, use_container_width=True)
+    if seccion == SECCIONES[0]:
+        fig_monthly = get_cached_figure(memo, vista + ('mensual',),
+                                        lambda: create_monthly_comparison_chart(cube, ultimo_mes_datos_reales, mask, años_referencia))
+        with perf_stage('render_mensual'):
+            st.plotly_chart(fig_monthly, use_container_width=True)
     
-    with tab2:
+    elif seccion == SECCIONES[1]:
         col1, col2 = st.columns(2)
         with col1:
-            fig_dist = create_distribution_chart(df_filtered, ultimo_mes_datos_reales)
-            st.plotly_chart(fig_dist, use_container_width=True)
+            fig_dist = get_cached_figure(memo, vista + ('distribucion',),
+                                         lambda: create_distribution_chart(cube, ultimo_mes_datos_reales, mask))
+            with perf_stage('render_distribucion'):
+                st.plotly_chart(fig_dist, use_container_width=True)
         
         with col2:
             # Gráfico de evolución por operación
-            op_data = df_filtered[(df_filtered['AñoMes'].str.startswith('2025')) & 
-                                 (df_filtered['Tipo'] == 'Real') & 
-                                 (df_filtered['AñoMes'] <= ultimo_mes_datos_reales)]
-            op_summary = op_data.groupby('Tipo_Operacion')['Ingresos'].sum().reset_index()
-            fig_op = px.bar(op_summary, x='Tipo_Operacion', y='Ingresos',
-                           title=f'Ingresos por Tipo de Operación (2025 hasta {ultimo_mes_datos_reales})',
-                           color='Ingresos', color_continuous_scale='viridis')
-            st.plotly_chart(fig_op, use_container_width=True)
-    
-    with tab3:
+            fig_op = get_cached_figure(memo, vista + ('operacion',),
+                                       lambda: create_operation_chart(cube, ultimo_mes_datos_reales, mask))
+            with perf_stage('render_operacion'):
+                st.plotly_chart(fig_op, use_container_width=True)
+    
+    elif seccion == SECCIONES[2]:
         st.subheader("📋 Resumen Comparativo")
         
         # Crear tabla resumen
-        summary_data = {
-            'Métrica': ['Transacciones', 'Ingresos', 'Recaudación', 'Precio Promedio (%)', 'Factura Promedio'],
-            'Real 2025': [
-                format_number(metrics['real_2025']['trx']),
-                format_currency(metrics['real_2025']['ingresos']),
-                format_currency(metrics['real_2025']['recaudacion']),
-                format_percentage(metrics['precio_prom_2025']),
-                format_currency(metrics['factura_prom_2025'])
-            ],
-            'Presupuesto 2025': [
-                format_number(metrics['presupuesto_2025']['trx']),
-                format_currency(metrics['presupuesto_2025']['ingresos']),
-                format_currency(metrics['presupuesto_2025']['recaudacion']),
-                format_percentage(metrics['precio_prom_presup_2025']),
-                format_currency(metrics['factura_prom_presup_2025'])
-            ],
-            'Real 2024': [
-                format_number(metrics['real_2024']['trx']),
-                format_currency(metrics['real_2024']['ingresos']),
-                format_currency(metrics['real_2024']['recaudacion']),
-                format_percentage(metrics['precio_prom_2024']),
-                format_currency(metrics['factura_prom_2024'])
-            ],
-            'Var. vs Presupuesto': [
-                format_percentage(metrics['var_presupuesto']['trx']),
-                format_percentage(metrics['var_presupuesto']['ingresos']),
-                format_percentage(metrics['var_presupuesto']['recaudacion']),
-                f"{(metrics['precio_prom_2025'] - metrics['precio_prom_presup_2025']):.1f}pp",
-                format_currency(metrics['factura_prom_2025'] - metrics['factura_prom_presup_2025'])
-            ],
-            'Var. vs 2024': [
-                format_percentage(metrics['var_año_anterior']['trx']),
-                format_percentage(metrics['var_año_anterior']['ingresos']),
-                format_percentage(metrics['var_año_anterior']['recaudacion']),
-                f"{(metrics['precio_prom_2025'] - metrics['precio_prom_2024']):.1f}pp",
-                format_currency(metrics['factura_prom_2025'] - metrics['factura_prom_2024'])
-            ]
-        }
-        
-        summary_df = pd.DataFrame(summary_data)
+        summary_df = build_summary_table(metrics)
         st.dataframe(summary_df, use_container_width=True)
     
-    with tab4:
+    elif seccion == SECCIONES[3]:
         st.subheader("🚨 Alertas e Insights")
         
-        # Generar alertas basadas en las métricas
-        alertas = []
-        
-        if metrics['var_presupuesto']['ingresos'] < -5:
-            alertas.append({
-                'tipo': 'error',
-                'mensaje': f"⚠️ ALERTA: Los ingresos están {format_percentage(abs(metrics['var_presupuesto']['ingresos']))} por debajo del presupuesto hasta {ultimo_mes_datos_reales}"
-            })
-        elif metrics['var_presupuesto']['ingresos'] > 5:
-            alertas.append({
-                'tipo': 'success',
-                'mensaje': f"✅ EXCELENTE: Los ingresos superan el presupuesto en {format_percentage(metrics['var_presupuesto']['ingresos'])} hasta {ultimo_mes_datos_reales}"
-            })
-        
-        if metrics['var_año_anterior']['trx'] > 10:
-            alertas.append({
-                'tipo': 'info',
-                'mensaje': f"📈 CRECIMIENTO: Las transacciones crecieron {format_percentage(metrics['var_año_anterior']['trx'])} vs 2024 hasta {ultimo_mes_datos_reales[-2:]}"
-            })
-        
-        precio_diff = metrics['precio_prom_2025'] - metrics['precio_prom_2024']
-        if precio_diff > 1:
-            alertas.append({
-                'tipo': 'warning',
-                'mensaje': f"💰 El precio promedio aumentó {precio_diff:.1f} puntos porcentuales respecto a 2024 hasta {ultimo_mes_datos_reales[-2:]}"
-            })
+        # Alertas según las reglas configurables, evaluadas sobre el total y cada segmento
+        try:
+            reglas_version = ALERT_RULES_PATH.stat().st_mtime
+            alertas = memo.get_or_compute(
+                vista + ('alertas', str(ALERT_RULES_PATH), reglas_version),
+                lambda: evaluate_alert_rules(cube, ultimo_mes_datos_reales, load_alert_rules(), mask, años_referencia))
+        except (OSError, ValueError) as e:
+            st.error(f"No se pudieron evaluar las reglas de alertas ({ALERT_RULES_PATH.name}): {e}")
+            alertas = None
         
-        # Mostrar alertas
-        if alertas:
-            for alerta in alertas:
-                if alerta['tipo'] == 'error':
-                    st.error(alerta['mensaje'])
-                elif alerta['tipo'] == 'success':
-                    st.success(alerta['mensaje'])
-                elif alerta['tipo'] == 'info':
-                    st.info(alerta['mensaje'])
-                elif alerta['tipo'] == 'warning':
-                    st.warning(alerta['mensaje'])
-        else:
-            st.info(f"📊 No hay alertas críticas en este momento hasta {ultimo_mes_datos_reales}")
+        if alertas is not None:
+            # Alertas del total de la vista, en el orden de las reglas
+            alertas_total = alertas[alertas['segmento'] == 'Total'].sort_values('orden')
+            if len(alertas_total):
+                for alerta in alertas_total.itertuples():
+                    getattr(st, alerta.nivel)(alerta.mensaje)
+            else:
+                st.info(f"📊 No hay alertas críticas en este momento hasta {ultimo_mes_datos_reales}")
+            
+            # Alertas por segmento, de la más grave a la más leve
+            alertas_segmento = alertas[alertas['segmento'] != 'Total']
+            if len(alertas_segmento):
+                st.markdown(f"**🔍 Alertas por segmento** ({len(alertas_segmento)}; se muestran las "
+                            f"{min(len(alertas_segmento), MAX_ALERTAS_SEGMENTO)} de mayor impacto)")
+                tabla = alertas_segmento.head(MAX_ALERTAS_SEGMENTO)[
+                    ['nivel', 'regla', 'Operación', 'Canal', 'Mes', 'valor', 'umbral', 'participacion']]
+                tabla = tabla.rename(columns={'nivel': 'Nivel', 'regla': 'Regla', 'valor': 'Valor',
+                                              'umbral': 'Umbral', 'participacion': 'Participación'})
+                tabla['Participación'] *= 100
+                st.dataframe(tabla, use_container_width=True, hide_index=True,
+                             column_config={'Valor': st.column_config.NumberColumn(format="%.1f"),
+                                            'Participación': st.column_config.NumberColumn(format="%.1f%%")})
+    
+    # Estadísticas de la caché de vistas (se leen al final para incluir este rerun)
+    cache_stats = memo.stats()
+    st.sidebar.caption(f"🧠 Caché de vistas: {cache_stats['aciertos']} aciertos · "
+                       f"{cache_stats['fallos']} fallos · {cache_stats['entradas']} entradas")
+    
+    # Panel de rendimiento (al final, para incluir todas las etapas del rerun)
+    stop_perf_recording()
+    render_perf_panel(registros_perf)
     
     # Footer
     st.markdown("---")
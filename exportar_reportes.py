@@ -0,0 +1,229 @@
+"""Exportación de reportes del dashboard por lotes, sin navegador.
+
+Parsea el dataset una vez, arma el cubo y genera un reporte por cada
+combinación de operación y canal (incluidos los totales) con los mismos
+KPIs, gráficos, tabla resumen y alertas que muestra el dashboard:
+calculate_metrics, build_kpis, build_summary_table, los constructores de
+gráficos y evaluate_alert_rules de dashboardClaude. Las combinaciones se
+reparten entre procesos de un pool; con fork (Linux) los workers
+comparten el dataset y el cubo del proceso principal sin copiarlos.
+
+Formatos:
+    html  página por combinación más un índice; plotly.js se escribe una
+          sola vez en la carpeta de salida, así que funciona sin conexión
+    xlsx  libro por combinación con KPIs, resumen, datos mensuales y alertas
+    pdf   un PDF por gráfico y combinación; requiere el paquete kaleido
+
+Uso:
+    python exportar_reportes.py datos.xlsx --salida reportes
+    python exportar_reportes.py datos.csv --ultimo-mes 2025-04 --formatos html xlsx --workers 8
+    python exportar_reportes.py --salida reportes_ejemplo
+    python exportar_reportes.py historia.sqlite --salida reportes --formatos xlsx
+"""
+import argparse
+import html
+import multiprocessing as mp
+import os
+import re
+import sys
+import time
+from pathlib import Path
+
+FORMATOS = ['html', 'xlsx', 'pdf']
+
+# Dataset, cubo y parámetros compartidos por los workers
+_contexto = {}
+
+
+def _init_worker(contexto):
+    _contexto.update(contexto)
+
+
+def cargar_dataset(ruta, streaming=False):
+    """Entrada del dataset con la misma ingesta (y caché en disco) que el dashboard.
+
+    Las bases .duckdb/.sqlite/.db se agregan en SQL: solo se lee su cubo.
+    """
+    import dashboardClaude as d
+    if ruta is None:
+        return d.make_entry(d.prepare_dataset(d.create_sample_data()))
+    ruta = Path(ruta)
+    if ruta.suffix.lower() in d.EXTENSIONES_DUCKDB + d.EXTENSIONES_SQLITE:
+        return d.make_source_entry(d.SQLSource(ruta))
+    data = ruta.read_bytes()
+    dataset_hash = d.hash_bytes(data)
+    if streaming:
+        return d.make_entry(d.stream_uploaded_bytes(data, dataset_hash + '-agregado', ruta.name))
+    return d.make_entry(d.parse_uploaded_bytes(data, dataset_hash, ruta.name))
+
+
+def combinaciones(cube):
+    """Filtros de cada reporte: todas las operaciones y canales, de a uno, más los totales"""
+    import dashboardClaude as d
+    opciones = d.filter_options(cube)
+    return [{'Tipo_Operacion': operacion, 'Tipo_Canal': canal}
+            for operacion in [[]] + [[v] for v in opciones['Tipo_Operacion']]
+            for canal in [[]] + [[v] for v in opciones['Tipo_Canal']]]
+
+
+def nombre_reporte(filtros):
+    """Nombre de archivo del reporte, p. ej. Pagos_Digital o Todos_Todos"""
+    partes = [valores[0] if valores else 'Todos' for valores in filtros.values()]
+    return '_'.join(re.sub(r'[^\w-]+', '-', str(p)).strip('-') for p in partes)
+
+
+def _html_tabla(df):
+    return df.to_html(index=False, border=0, classes='tabla', escape=True)
+
+
+def escribir_html(ruta, titulo, kpis, resumen, figuras, alertas):
+    """Página del reporte; los gráficos usan el plotly.min.js de la misma carpeta"""
+    tarjetas = ''.join(
+        f"<div class='kpi'><div class='label'>{html.escape(label)}</div>"
+        f"<div class='valor'>{html.escape(valor)}</div><div class='delta'>{html.escape(delta or '')}</div></div>"
+        for label, valor, delta in kpis)
+    graficos = ''.join(fig.to_html(full_html=False, include_plotlyjs=False) for fig in figuras.values())
+    mensajes = ''.join(f"<li class='{a.nivel}'>{html.escape(a.mensaje)}</li>" for a in alertas.itertuples())
+    ruta.write_text(f"""<!DOCTYPE html>
+<html lang="es"><head><meta charset="utf-8"><title>{html.escape(titulo)}</title>
+<script src="plotly.min.js"></script>
+<style>
+body {{ font-family: sans-serif; margin: 2rem; color: #1f2937; }}
+.kpis {{ display: flex; gap: 1rem; }}
+.kpi {{ flex: 1; padding: 1rem; border-radius: 10px; background: #f3f4f6; }}
+.kpi .valor {{ font-size: 1.6rem; font-weight: bold; }}
+.tabla {{ border-collapse: collapse; }} .tabla td, .tabla th {{ padding: .3rem .8rem; border-bottom: 1px solid #ddd; }}
+.error {{ color: #b91c1c; }} .warning {{ color: #b45309; }} .success {{ color: #15803d; }}
+</style></head><body>
+<h1>{html.escape(titulo)}</h1>
+<h2>📈 Indicadores Clave de Desempeño</h2><div class="kpis">{tarjetas}</div>
+<h2>📊 Análisis Visual</h2>{graficos}
+<h2>📋 Resumen Comparativo</h2>{_html_tabla(resumen)}
+<h2>🚨 Alertas e Insights</h2><ul>{mensajes or '<li>📊 No hay alertas críticas en este momento</li>'}</ul>
+</body></html>""", encoding='utf-8')
+
+
+def escribir_xlsx(ruta, kpis, resumen, mensual, alertas):
+    """Libro del reporte: una hoja por sección"""
+    import pandas as pd
+    with pd.ExcelWriter(ruta, engine='openpyxl') as writer:
+        pd.DataFrame(kpis, columns=['Indicador', 'Valor', 'Variación']).to_excel(writer, sheet_name='KPIs', index=False)
+        resumen.to_excel(writer, sheet_name='Resumen', index=False)
+        mensual.assign(AñoMes=mensual['AñoMes'].astype(str), Tipo=mensual['Tipo'].astype(str)).to_excel(
+            writer, sheet_name='Mensual', index=False)
+        alertas.drop(columns='orden').to_excel(writer, sheet_name='Alertas', index=False)
+
+
+def generar_reporte(filtros):
+    """Generar los archivos de una combinación de filtros y devolver sus rutas"""
+    import dashboardClaude as d
+    cube, indice = _contexto['cube'], _contexto['indice']
+    ultimo, referencias = _contexto['ultimo_mes'], _contexto['años_referencia']
+    salida, formatos = _contexto['salida'], _contexto['formatos']
+    mask = indice.mask(filtros)
+    metrics = d.calculate_metrics(cube, ultimo, mask, referencias)
+    kpis = d.build_kpis(metrics, ultimo)
+    resumen = d.build_summary_table(metrics)
+    figuras = {
+        'mensual': d.create_monthly_comparison_chart(cube, ultimo, mask, referencias),
+        'distribucion': d.create_distribution_chart(cube, ultimo, mask),
+        'operacion': d.create_operation_chart(cube, ultimo, mask),
+    }
+    alertas = d.evaluate_alert_rules(cube, ultimo, _contexto['reglas'], mask, referencias)
+    alertas_total = alertas[alertas['segmento'] == 'Total'].sort_values('orden')
+
+    nombre = nombre_reporte(filtros)
+    titulo = (f"Dashboard GIRE · Operación: {filtros['Tipo_Operacion'][0] if filtros['Tipo_Operacion'] else 'Todos'}"
+              f" · Canal: {filtros['Tipo_Canal'][0] if filtros['Tipo_Canal'] else 'Todos'} · hasta {ultimo}")
+    archivos = []
+    if 'html' in formatos:
+        archivos.append(salida / f"{nombre}.html")
+        escribir_html(archivos[-1], titulo, kpis, resumen, figuras, alertas_total)
+    if 'xlsx' in formatos:
+        archivos.append(salida / f"{nombre}.xlsx")
+        escribir_xlsx(archivos[-1], kpis, resumen, d.compute_monthly_data(cube, ultimo, mask, referencias), alertas)
+    if 'pdf' in formatos:
+        for grafico, fig in figuras.items():
+            archivos.append(salida / f"{nombre}_{grafico}.pdf")
+            fig.write_image(archivos[-1], format='pdf', width=1400, height=900 if grafico == 'mensual' else 600)
+    return nombre, [str(a) for a in archivos]
+
+
+def escribir_indice(salida, reportes, ultimo):
+    """Índice HTML con un enlace por reporte"""
+    filas = ''.join(
+        f"<li>{html.escape(nombre)}: " + ' · '.join(
+            f"<a href='{html.escape(Path(a).name)}'>{html.escape(Path(a).suffix[1:])}</a>" for a in archivos) + "</li>"
+        for nombre, archivos in reportes)
+    (salida / 'index.html').write_text(
+        f"<!DOCTYPE html><html lang='es'><head><meta charset='utf-8'><title>Reportes hasta {ultimo}</title></head>"
+        f"<body><h1>Reportes hasta {ultimo}</h1><ul>{filas}</ul></body></html>", encoding='utf-8')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('dataset', nargs='?', help='Archivo .xlsx/.xls/.csv o base .duckdb/.sqlite/.db; '
+                                                   'sin archivo se usan los datos de ejemplo')
+    parser.add_argument('--salida', type=Path, default=Path('reportes'))
+    parser.add_argument('--ultimo-mes', help='Último mes de datos reales (YYYY-MM); por defecto el más reciente')
+    parser.add_argument('--años-referencia', nargs='*', type=int,
+                        help='Años contra los que se compara; por defecto los del dashboard')
+    parser.add_argument('--formatos', nargs='+', choices=FORMATOS, default=['html', 'xlsx'])
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--streaming', action='store_true', help='Ingesta por bloques (archivos muy grandes)')
+    args = parser.parse_args()
+
+    import dashboardClaude as d
+    if 'pdf' in args.formatos:
+        try:
+            import kaleido  # noqa: F401
+        except ImportError:
+            parser.error("el formato pdf requiere el paquete kaleido (pip install kaleido)")
+
+    inicio = time.perf_counter()
+    entry = cargar_dataset(args.dataset, args.streaming)
+    ultimo_mes, meses_actuales = entry['periodos']
+    if ultimo_mes is None:
+        sys.exit("El dataset no tiene datos reales")
+    if args.ultimo_mes:
+        if args.ultimo_mes not in meses_actuales:
+            sys.exit(f"Último mes inválido {args.ultimo_mes}; disponibles: {', '.join(meses_actuales)}")
+        ultimo_mes = args.ultimo_mes
+    referencias = args.años_referencia
+    if referencias is None:
+        referencias = d.reference_year_options(entry['cube'], ultimo_mes)[1]
+
+    args.salida.mkdir(parents=True, exist_ok=True)
+    if 'html' in args.formatos:
+        # plotly.js una sola vez, compartido por todas las páginas
+        from plotly.offline import get_plotlyjs
+        (args.salida / 'plotly.min.js').write_text(get_plotlyjs(), encoding='utf-8')
+
+    contexto = {
+        'cube': entry['cube'],
+        'indice': entry['indice'],
+        'ultimo_mes': ultimo_mes,
+        'años_referencia': referencias,
+        'reglas': d.load_alert_rules(),
+        'salida': args.salida,
+        'formatos': args.formatos,
+    }
+    tareas = combinaciones(entry['cube'])
+    print(f"{entry['filas']:,} filas, cubo de {len(entry['cube']):,} filas; "
+          f"{len(tareas)} reportes hasta {ultimo_mes} con {args.workers} workers")
+
+    # Con fork los workers heredan el contexto sin serializarlo
+    metodo = 'fork' if 'fork' in mp.get_all_start_methods() else 'spawn'
+    reportes = []
+    with mp.get_context(metodo).Pool(args.workers, initializer=_init_worker, initargs=(contexto,)) as pool:
+        for i, (nombre, archivos) in enumerate(pool.imap_unordered(generar_reporte, tareas), start=1):
+            reportes.append((nombre, archivos))
+            print(f"  [{i}/{len(tareas)}] {nombre}")
+    reportes.sort()
+    if 'html' in args.formatos:
+        escribir_indice(args.salida, reportes, ultimo_mes)
+    print(f"{sum(len(a) for _, a in reportes)} archivos en {args.salida} ({time.perf_counter() - inicio:.1f} s)")
+
+
+if __name__ == '__main__':
+    main()